@@ -0,0 +1,75 @@
+import hashlib
+import io
+from typing import BinaryIO
+
+import mutagen
+from mutagen.mp3 import MP3
+from mutagen.wave import WAVE
+from pydantic import BaseModel
+
+
+class AudioMetadata(BaseModel):
+    duration: int
+    bitrate: int | None = None
+    sample_rate: int | None = None
+    channels: int | None = None
+    content_hash: str
+
+
+class AudioMetadataReader:
+    """
+    File-like wrapper that hashes audio bytes while they are streamed to storage.
+
+    Pass it as the upload source. Every byte read by the uploader also goes into
+    a SHA-256 digest, so the file is only read once end to end. Resumable
+    uploads that seek back to retry a chunk are not hashed twice.
+    `finalize()` then parses the stream info (duration, bitrate, sample rate,
+    channels) from the MP3 or WAV headers, which only touches a few kilobytes.
+    """
+
+    def __init__(self, file: BinaryIO):
+        self._file = file
+        self._digest = hashlib.sha256()
+        self._hashed_upto = 0
+
+    def read(self, size: int = -1) -> bytes:
+        position = self._file.tell()
+        data = self._file.read(size)
+        end = position + len(data)
+        if position <= self._hashed_upto < end:
+            self._digest.update(data[self._hashed_upto - position :])
+            self._hashed_upto = end
+        return data
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return self._file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def finalize(self) -> AudioMetadata:
+        # Hash whatever the uploader did not consume (normally nothing)
+        self._file.seek(self._hashed_upto)
+        while self.read(1024 * 1024):
+            pass
+
+        self._file.seek(0)
+        audio = mutagen.File(self._file, options=[MP3, WAVE])
+        self._file.seek(0)
+        if audio is None or audio.info is None:
+            raise ValueError("Unsupported or corrupted audio file")
+
+        info = audio.info
+        return AudioMetadata(
+            duration=int(round(info.length)),
+            bitrate=getattr(info, "bitrate", None),
+            sample_rate=getattr(info, "sample_rate", None),
+            channels=getattr(info, "channels", None),
+            content_hash=self._digest.hexdigest(),
+        )
@@ -0,0 +1,155 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import logging
+import threading
+
+from sqlalchemy import event, insert
+from sqlmodel import Session, select
+
+from .bucket_functions import delete_file
+from .config import config
+from .dependencies.cloud_storage import get_bucket
+from .dependencies.db import get_engine
+from .models import Blob_Deletions
+
+logger = logging.getLogger(__name__)
+
+
+def queue_blob_deletion(session: Session, blob_name: str):
+    """Delete `blob_name` from storage once the session's transaction commits."""
+    session.add(Blob_Deletions(blob_name=blob_name))
+    session.info["pending_blob_deletions"] = True
+
+
+def queue_blob_deletions(session: Session, blob_names: list[str]):
+    """Bulk variant of `queue_blob_deletion` that skips the ORM unit of work."""
+    now = datetime.now(timezone.utc)
+    rows = [
+        {"blob_name": name, "created_at": now, "next_attempt_at": now}
+        for name in blob_names
+        if name
+    ]
+    if not rows:
+        return
+    session.execute(insert(Blob_Deletions), rows)
+    session.info["pending_blob_deletions"] = True
+
+
+class BlobDeletionWorker:
+    """
+    Background thread that drains the `Blob_Deletions` outbox.
+
+    Rows are claimed in batches with `SELECT ... FOR UPDATE SKIP LOCKED`, so
+    several API processes can run a worker side by side. The blobs of a batch
+    are deleted in parallel; failed rows are retried with exponential backoff
+    until `blob_deletion_max_attempts` is reached and then left for inspection.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = config.blob_deletion_batch_size,
+        concurrency: int = config.blob_deletion_concurrency,
+        max_attempts: int = config.blob_deletion_max_attempts,
+        poll_interval: float = config.blob_deletion_poll_interval,
+    ):
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._executor: ThreadPoolExecutor | None = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="blob-deletion"
+        )
+        self._thread = threading.Thread(
+            target=self._run, name="blob-deletion-worker", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float | None = 10):
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._wake.set()
+        self._thread.join(timeout)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._thread = None
+        self._executor = None
+
+    def notify(self):
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                processed = self.run_once()
+            except Exception:
+                logger.exception("Blob deletion batch failed")
+                processed = 0
+
+            # Keep draining while there is a backlog, otherwise wait for a commit
+            if processed < self.batch_size:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def _delete(self, blob_name: str) -> str | None:
+        try:
+            delete_file(get_bucket(), blob_name)
+            return None
+        except Exception as e:
+            return str(e)
+
+    def run_once(self) -> int:
+        """Process one batch of due deletions and return how many were claimed."""
+        now = datetime.now(timezone.utc)
+        with Session(get_engine()) as session:
+            rows = session.exec(
+                select(Blob_Deletions)
+                .where(
+                    Blob_Deletions.next_attempt_at <= now,
+                    Blob_Deletions.attempts < self.max_attempts,
+                )
+                .order_by(Blob_Deletions.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            ).all()
+            if not rows:
+                return 0
+
+            blob_names = [row.blob_name for row in rows]
+            if self._executor is not None:
+                errors = list(self._executor.map(self._delete, blob_names))
+            else:
+                with ThreadPoolExecutor(self.concurrency) as executor:
+                    errors = list(executor.map(self._delete, blob_names))
+
+            for row, error in zip(rows, errors):
+                if error is None:
+                    session.delete(row)
+                    continue
+                row.attempts += 1
+                row.last_error = error[:1000]
+                row.next_attempt_at = now + timedelta(
+                    seconds=self.poll_interval * 2**row.attempts
+                )
+                session.add(row)
+                logger.warning("Failed to delete blob %s: %s", row.blob_name, error)
+
+            session.commit()
+            return len(rows)
+
+
+blob_deletion_worker = BlobDeletionWorker()
+
+
+@event.listens_for(Session, "after_commit")
+def _notify_blob_deletion_worker(session):
+    if session.info.pop("pending_blob_deletions", False):
+        blob_deletion_worker.notify()
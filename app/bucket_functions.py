@@ -1,20 +1,36 @@
 from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
 from google.cloud import storage
+from google.api_core.exceptions import NotFound
+import asyncio
+from typing import BinaryIO
 import random
 import string
 
+from .config import config
 
-def upload_file(bucket: storage.Bucket, user_id: str, file: UploadFile, folder_name: str):
+
+def upload_file(
+    bucket: storage.Bucket,
+    user_id: str,
+    file: UploadFile,
+    folder_name: str,
+    source: BinaryIO | None = None,
+):
     random_string = "".join(
         random.choices(string.ascii_uppercase + string.digits, k=12)
     )
 
     filename = f"{folder_name}/{user_id}_{random_string}_{file.filename}"
-    blob = bucket.blob(filename)
+    if file.size is not None and file.size > config.resumable_upload_threshold:
+        # Large files are sent as a resumable upload in fixed size chunks
+        blob = bucket.blob(filename, chunk_size=config.upload_chunk_size)
+    else:
+        blob = bucket.blob(filename)
 
     generation_match_precondition = 0
     blob.upload_from_file(
-        file.file,
+        source if source is not None else file.file,
         content_type=file.content_type,
         if_generation_match=generation_match_precondition,
     )
@@ -24,6 +40,48 @@ def upload_file(bucket: storage.Bucket, user_id: str, file: UploadFile, folder_n
 
 def delete_file(bucket: storage.Bucket, filename: str):
     fileToDelete = bucket.blob(filename)
-    fileToDelete.reload()
-    generation_match_precondition = fileToDelete.generation
-    fileToDelete.delete(if_generation_match=generation_match_precondition)
+    try:
+        fileToDelete.delete()
+    except NotFound:
+        # Already gone, e.g. a retried deletion
+        pass
+
+
+async def upload_files(
+    bucket: storage.Bucket,
+    user_id: str,
+    files: list[tuple[UploadFile, str] | tuple[UploadFile, str, BinaryIO]],
+) -> list[tuple[str, str]]:
+    """
+    Upload several files concurrently on worker threads.
+
+    Args:
+        files: (file, folder_name) pairs to upload, optionally with a third
+            item used as the stream to read instead of `file.file`.
+
+    Returns:
+        (blob name, public url) pairs in the same order as `files`.
+
+    If any upload fails, the files that did succeed are deleted again before
+    the first error is re-raised.
+    """
+    results = await asyncio.gather(
+        *[
+            run_in_threadpool(upload_file, bucket, user_id, *entry)
+            for entry in files
+        ],
+        return_exceptions=True,
+    )
+
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        uploaded = [
+            result[0] for result in results if not isinstance(result, BaseException)
+        ]
+        await asyncio.gather(
+            *[run_in_threadpool(delete_file, bucket, name) for name in uploaded],
+            return_exceptions=True,
+        )
+        raise errors[0]
+
+    return results
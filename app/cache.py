@@ -0,0 +1,186 @@
+"""
+Read-through cache for serialized entity payloads.
+
+Hot GET endpoints store the JSON of their response model here, keyed by entity
+kind and id, and mutating handlers invalidate the keys they touch. Entries also
+expire after `cache_ttl_seconds`, which bounds staleness for changes that are
+not invalidated explicitly (e.g. a singer renaming their account).
+
+The storage backend is pluggable:
+
+- "memory": per-process LRU with TTL (default)
+- "redis": shared Redis store at `cache_url`, so all workers see invalidations
+- "local_redis": in-process stand-in with the Redis client interface, for tests
+"""
+
+from collections import OrderedDict
+from datetime import datetime
+from typing import NamedTuple
+import threading
+import time
+
+from pydantic import BaseModel
+
+from .config import config
+
+
+class MemoryCache:
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def get_many(self, keys: list[str]) -> list[bytes | None]:
+        return [self.get(key) for key in keys]
+
+    def set(self, key: str, value: bytes, ttl: float | None = None):
+        expires_at = time.monotonic() + (ttl if ttl is not None else self.ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class LocalRedis:
+    """Minimal in-process stand-in for the `redis.Redis` commands used here."""
+
+    def __init__(self):
+        self._store = MemoryCache(max_entries=2**31, ttl=float("inf"))
+
+    def get(self, name: str) -> bytes | None:
+        return self._store.get(name)
+
+    def mget(self, names: list[str]) -> list[bytes | None]:
+        return self._store.get_many(names)
+
+    def set(self, name: str, value: bytes, ex: int | None = None):
+        self._store.set(name, value, ttl=ex)
+
+    def delete(self, *names: str):
+        self._store.delete(*names)
+
+    def flushdb(self):
+        self._store.clear()
+
+
+class RedisCache:
+    def __init__(self, client, ttl: float):
+        self.client = client
+        self.ttl = ttl
+
+    def get(self, key: str) -> bytes | None:
+        return self.client.get(key)
+
+    def get_many(self, keys: list[str]) -> list[bytes | None]:
+        # One MGET round trip instead of one GET per key
+        return self.client.mget(keys) if keys else []
+
+    def set(self, key: str, value: bytes, ttl: float | None = None):
+        self.client.set(key, value, ex=int(ttl if ttl is not None else self.ttl))
+
+    def delete(self, *keys: str):
+        if keys:
+            self.client.delete(*keys)
+
+    def clear(self):
+        self.client.flushdb()
+
+
+def create_cache_backend():
+    if config.cache_backend == "memory":
+        return MemoryCache(config.cache_max_entries, config.cache_ttl_seconds)
+    if config.cache_backend == "local_redis":
+        return RedisCache(LocalRedis(), config.cache_ttl_seconds)
+    if config.cache_backend == "redis":
+        import redis
+
+        client = redis.Redis.from_url(config.cache_url)
+        return RedisCache(client, config.cache_ttl_seconds)
+    raise ValueError(f"Unknown cache backend: {config.cache_backend}")
+
+
+class CachedEntity(NamedTuple):
+    body: bytes
+    etag: str
+    last_modified: datetime
+
+
+class EntityCache:
+    def __init__(self, backend, prefix: str = "entity"):
+        self.backend = backend
+        self.prefix = prefix
+
+    def key(self, kind: str, id: int) -> str:
+        return f"{self.prefix}:{kind}:{id}"
+
+    @staticmethod
+    def _parse(value: bytes) -> CachedEntity:
+        etag, last_modified, body = value.split(b"\n", 2)
+        return CachedEntity(
+            body, etag.decode(), datetime.fromisoformat(last_modified.decode())
+        )
+
+    def get(self, kind: str, id: int) -> CachedEntity | None:
+        value = self.backend.get(self.key(kind, id))
+        return None if value is None else self._parse(value)
+
+    def get_many(self, kind: str, ids: list[int]) -> dict[int, CachedEntity]:
+        """Cached entities among `ids`, keyed by id; misses are left out."""
+        values = self.backend.get_many([self.key(kind, id) for id in ids])
+        return {
+            id: self._parse(value)
+            for id, value in zip(ids, values)
+            if value is not None
+        }
+
+    def set(
+        self,
+        kind: str,
+        id: int,
+        payload: BaseModel,
+        etag: str,
+        last_modified: datetime,
+    ) -> CachedEntity:
+        """Store `payload` together with the validators it was built from."""
+        body = payload.model_dump_json().encode()
+        header = f"{etag}\n{last_modified.isoformat()}\n".encode()
+        self.backend.set(self.key(kind, id), header + body)
+        return CachedEntity(body, etag, last_modified)
+
+    def get_count(self, kind: str, id: int) -> int | None:
+        value = self.backend.get(self.key(kind, id))
+        return None if value is None else int(value)
+
+    def set_count(self, kind: str, id: int, count: int):
+        self.backend.set(self.key(kind, id), str(count).encode())
+
+    def invalidate(self, kind: str, *ids: int | None):
+        keys = [self.key(kind, id) for id in ids if id is not None]
+        if keys:
+            self.backend.delete(*keys)
+
+
+entity_cache = EntityCache(create_cache_backend())
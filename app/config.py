@@ -1,6 +1,21 @@
+import os
+
+from pydantic import field_validator
 from pydantic_settings import BaseSettings
 
 
+def parse_cpu_list(value: str) -> set[int]:
+    """CPU ids from a list like "0-3,6"."""
+    cpus = set()
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start, _, end = part.partition("-")
+        cpus.update(range(int(start), int(end or start) + 1))
+    return cpus
+
+
 class Config(BaseSettings):
     db_username: str
     db_password: str
@@ -9,6 +24,71 @@ class Config(BaseSettings):
     secret_key: str
     bucket_name: str
     google_application_credentials: str | None = None
+    storage_backend: str = "gcs"  # "gcs" or "local"
+    local_storage_path: str = "local_bucket"
+    storage_pool_connections: int = 16
+    storage_pool_maxsize: int = 64
+    storage_max_retries: int = 3
+    resumable_upload_threshold: int = 8 * 1024 * 1024
+    upload_chunk_size: int = 4 * 1024 * 1024  # must be a multiple of 256 KB
+    blob_deletion_batch_size: int = 100
+    blob_deletion_concurrency: int = 16
+    blob_deletion_max_attempts: int = 8
+    blob_deletion_poll_interval: float = 30
+    bulk_delete_chunk_size: int = 1000
+    cache_backend: str = "memory"  # "memory", "redis" or "local_redis"
+    cache_url: str | None = None
+    cache_max_entries: int = 10000
+    cache_ttl_seconds: int = 60
+    http_cache_max_age: int = 30
+    http_cache_stale_while_revalidate: int = 60
+    feed_max_entries: int = 500
+    feed_trim_slack: int = 100
+    feed_fanout_max_followers: int = 10000
+    feed_backfill_posts: int = 20
+    counter_reconcile_chunk_size: int = 1000
+    history_batch_max_events: int = 500
+    batch_max_ids: int = 100
+    recommender_model_dir: str | None = None
+    recommender_logits_mode: str = "positions"  # "positions" or "last"
+    # "numpy" serves memory-mapped weights from `gru4rec_weights` without TensorFlow
+    recommender_backend: str = "tensorflow"
+    # Load the model at import time so a pre-fork master shares it with workers
+    model_preload: bool = False
+    # Clusters scanned per "similar songs" query; more is slower and more exact
+    similar_songs_n_probe: int = 8
+    # Precomputed recommendations are served while younger than this
+    recommendations_max_age_hours: float = 24
+    recommendations_active_days: int = 1
+    recommendations_batch_chunk_size: int = 500
+    recommendations_batch_processes: int | None = None  # None: one per core
+    # TensorFlow thread pools per worker process; None keeps TF's default (all cores)
+    tf_intra_op_threads: int | None = None
+    tf_inter_op_threads: int | None = None
+    inference_threads: int = 1
+    inference_cpu_affinity: str | None = None  # e.g. "0-3" or "0,2,4"
+
+    @field_validator("inference_cpu_affinity")
+    @classmethod
+    def check_cpu_affinity(cls, value: str | None) -> str | None:
+        # Checked here so a bad value fails at startup, not in every inference
+        # thread's initializer
+        if value is None:
+            return value
+        try:
+            cpus = parse_cpu_list(value)
+        except ValueError:
+            raise ValueError(f"not a CPU list like 0-3,6: {value!r}")
+        if not cpus:
+            raise ValueError("must name at least one CPU")
+        if hasattr(os, "sched_getaffinity"):
+            unavailable = cpus - os.sched_getaffinity(0)
+            if unavailable:
+                raise ValueError(
+                    "CPUs not available to this process: "
+                    + ",".join(map(str, sorted(unavailable)))
+                )
+        return value
 
     class Config:
         env_file = ".env"  # Optional, for local development
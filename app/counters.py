@@ -0,0 +1,33 @@
+"""
+Denormalized counters (`like_count`, `follower_count`, `following_count`).
+
+Counters are changed with a single `UPDATE ... SET x = x + :delta` so
+concurrent likes or follows never overwrite each other, and the row lock is
+held only for that statement instead of from the read until the commit.
+
+The statement pins `updated_at` so the column's `onupdate` does not fire: a
+counter change is not an edit, and bumping `updated_at` on every like would
+change the ETag of the entity and of every album or playlist listing it.
+"""
+
+from collections.abc import Iterable
+
+from sqlalchemy import update
+from sqlmodel import Session
+
+
+def increment(session: Session, column, ids: int | Iterable[int], delta: int = 1):
+    """Add `delta` to `column` on the rows with primary key `ids`."""
+    model = column.class_
+    ids = [ids] if isinstance(ids, int) else list(ids)
+    if not ids:
+        return
+    values = {column: column + delta}
+    if hasattr(model, "updated_at"):
+        values[model.updated_at] = model.updated_at
+    session.execute(
+        update(model)
+        .where(model.id.in_(ids))
+        .values(values)
+        .execution_options(synchronize_session=False)
+    )
@@ -0,0 +1,249 @@
+"""
+Set-based cascade deletion for users, albums and playlists.
+
+Deleting through `session.delete()` makes the ORM load every dependent row
+(histories, likes, follows, ...) before deleting them one by one. The helpers
+here instead issue chunked `DELETE ... WHERE key IN (...)` statements and commit
+after each chunk, so memory use and lock time stay bounded no matter how large
+the account is. A run that is interrupted can simply be repeated.
+
+Denormalized counters on rows that survive (`follower_count`,
+`following_count`, `like_count`) are adjusted chunk by chunk, and storage blobs
+are queued in the blob deletion outbox. Entity cache entries of deleted or
+changed songs, albums, playlists and posts are invalidated after each chunk
+commits.
+"""
+
+from typing import Any, Callable
+
+from sqlalchemy import delete, select, tuple_
+from sqlmodel import Session, SQLModel
+
+from .blob_deletion import queue_blob_deletions
+from .cache import entity_cache
+from .config import config
+from .counters import increment
+from .models import (
+    Albums,
+    Comments,
+    Feed_Entries,
+    Follows,
+    Histories,
+    Playlist_Songs,
+    Playlists,
+    Post_Likes,
+    Posts,
+    Song_Likes,
+    Songs,
+    User_Recommendations,
+    Users,
+)
+
+
+def _primary_key(model: type[SQLModel]):
+    return list(model.__table__.primary_key.columns)
+
+
+def _delete_in_chunks(
+    session: Session,
+    model: type[SQLModel],
+    *where: Any,
+    columns: tuple = (),
+    before_delete: Callable[[list], None] | None = None,
+    after_delete: Callable[[list], None] | None = None,
+    chunk_size: int | None = None,
+):
+    """
+    Delete the rows of `model` matching `where`, one chunk per transaction.
+
+    `before_delete` receives the selected rows of each chunk (primary key
+    followed by `columns`) before the chunk is deleted. Its plain statements
+    (counter updates, blob queueing) commit together with the delete. Nested
+    `_delete_in_chunks` calls in it, which delete dependent rows, commit each
+    of their own chunks first. If the parent chunk then fails, the dependents
+    stay deleted and the parent rows stay; every step only deletes what still
+    matches, so running the cascade again finishes it.
+    `after_delete` receives the rows once the chunk is committed, e.g. to
+    invalidate caches without letting a concurrent read re-cache the old rows.
+    """
+    chunk_size = chunk_size or config.bulk_delete_chunk_size
+    key = _primary_key(model)
+    while True:
+        rows = session.execute(
+            select(*key, *columns).where(*where).limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+        if before_delete is not None:
+            before_delete(rows)
+        if len(key) == 1:
+            condition = key[0].in_([row[0] for row in rows])
+        else:
+            condition = tuple_(*key).in_([tuple(row[: len(key)]) for row in rows])
+        session.execute(
+            delete(model)
+            .where(condition)
+            .execution_options(synchronize_session=False)
+        )
+        session.commit()
+        if after_delete is not None:
+            after_delete(rows)
+
+
+def _invalidate_playlists(rows):
+    entity_cache.invalidate("playlist", *{row.playlist_id for row in rows})
+
+
+def _delete_songs(session: Session, *where: Any):
+    def delete_song_dependents(rows):
+        song_ids = [row.id for row in rows]
+        _delete_in_chunks(session, Histories, Histories.song_id.in_(song_ids))
+        _delete_in_chunks(session, Song_Likes, Song_Likes.song_id.in_(song_ids))
+        _delete_in_chunks(
+            session,
+            Playlist_Songs,
+            Playlist_Songs.song_id.in_(song_ids),
+            after_delete=_invalidate_playlists,
+        )
+        _delete_in_chunks(
+            session, User_Recommendations, User_Recommendations.song_id.in_(song_ids)
+        )
+        queue_blob_deletions(
+            session, [name for row in rows for name in (row.cover, row.song)]
+        )
+
+    def invalidate_songs(rows):
+        album_ids = {row.album_id for row in rows}
+        entity_cache.invalidate("song", *[row.id for row in rows])
+        entity_cache.invalidate("album", *album_ids)
+        entity_cache.invalidate("album_song_count", *album_ids)
+
+    _delete_in_chunks(
+        session,
+        Songs,
+        *where,
+        columns=(Songs.cover, Songs.song, Songs.album_id),
+        before_delete=delete_song_dependents,
+        after_delete=invalidate_songs,
+    )
+
+
+def _delete_posts(session: Session, *where: Any):
+    def delete_post_dependents(rows):
+        post_ids = [row.id for row in rows]
+        _delete_in_chunks(session, Comments, Comments.post_id.in_(post_ids))
+        _delete_in_chunks(session, Post_Likes, Post_Likes.post_id.in_(post_ids))
+        _delete_in_chunks(session, Feed_Entries, Feed_Entries.post_id.in_(post_ids))
+
+    _delete_in_chunks(
+        session,
+        Posts,
+        *where,
+        before_delete=delete_post_dependents,
+        after_delete=lambda rows: entity_cache.invalidate(
+            "post", *[row.id for row in rows]
+        ),
+    )
+
+
+def _delete_playlists(session: Session, *where: Any):
+    def delete_playlist_songs(rows):
+        playlist_ids = [row.id for row in rows]
+        _delete_in_chunks(
+            session, Playlist_Songs, Playlist_Songs.playlist_id.in_(playlist_ids)
+        )
+
+    _delete_in_chunks(
+        session,
+        Playlists,
+        *where,
+        before_delete=delete_playlist_songs,
+        after_delete=lambda rows: entity_cache.invalidate(
+            "playlist", *[row.id for row in rows]
+        ),
+    )
+
+
+def _delete_albums(session: Session, *where: Any):
+    def delete_album_songs(rows):
+        _delete_songs(session, Songs.album_id.in_([row.id for row in rows]))
+        queue_blob_deletions(session, [row.cover for row in rows])
+
+    def invalidate_albums(rows):
+        album_ids = [row.id for row in rows]
+        entity_cache.invalidate("album", *album_ids)
+        entity_cache.invalidate("album_song_count", *album_ids)
+
+    _delete_in_chunks(
+        session,
+        Albums,
+        *where,
+        columns=(Albums.cover,),
+        before_delete=delete_album_songs,
+        after_delete=invalidate_albums,
+    )
+
+
+def delete_playlist_cascade(session: Session, playlist_id: int):
+    _delete_playlists(session, Playlists.id == playlist_id)
+
+
+def delete_album_cascade(session: Session, album_id: int):
+    _delete_albums(session, Albums.id == album_id)
+
+
+def delete_user_cascade(session: Session, user_id: int):
+    # Rows the user created on other people's content, fixing their counters
+    _delete_in_chunks(
+        session,
+        Song_Likes,
+        Song_Likes.user_id == user_id,
+        before_delete=lambda rows: increment(
+            session, Songs.like_count, [row.song_id for row in rows], -1
+        ),
+        after_delete=lambda rows: entity_cache.invalidate(
+            "song", *[row.song_id for row in rows]
+        ),
+    )
+    _delete_in_chunks(
+        session,
+        Post_Likes,
+        Post_Likes.user_id == user_id,
+        before_delete=lambda rows: increment(
+            session, Posts.like_count, [row.post_id for row in rows], -1
+        ),
+        after_delete=lambda rows: entity_cache.invalidate(
+            "post", *[row.post_id for row in rows]
+        ),
+    )
+    _delete_in_chunks(
+        session,
+        Follows,
+        Follows.follower_id == user_id,
+        before_delete=lambda rows: increment(
+            session, Users.follower_count, [row.user_id for row in rows], -1
+        ),
+    )
+    _delete_in_chunks(
+        session,
+        Follows,
+        Follows.user_id == user_id,
+        before_delete=lambda rows: increment(
+            session, Users.following_count, [row.follower_id for row in rows], -1
+        ),
+    )
+    _delete_in_chunks(session, Comments, Comments.user_id == user_id)
+    _delete_in_chunks(session, Histories, Histories.user_id == user_id)
+    _delete_in_chunks(session, Feed_Entries, Feed_Entries.user_id == user_id)
+    _delete_in_chunks(
+        session, User_Recommendations, User_Recommendations.user_id == user_id
+    )
+
+    # Content owned by the user
+    _delete_playlists(session, Playlists.user_id == user_id)
+    _delete_posts(session, Posts.user_id == user_id)
+    _delete_albums(session, Albums.singer_id == user_id)
+    _delete_songs(session, Songs.singer_id == user_id)
+
+    session.execute(delete(Users).where(Users.id == user_id))
+    session.commit()
@@ -0,0 +1,32 @@
+from typing import Annotated
+
+from fastapi import Depends, HTTPException, Query
+
+from ..config import config
+
+
+def get_batch_ids(
+    ids: Annotated[
+        str,
+        Query(description="Comma-separated ids, e.g. `3,1,2`. Order is preserved"),
+    ],
+) -> list[int]:
+    try:
+        parsed = [int(item) for item in ids.split(",") if item.strip()]
+    except ValueError:
+        raise HTTPException(
+            status_code=400, detail="ids must be comma-separated integers"
+        )
+    # Drop repeated ids, keeping the first occurrence
+    parsed = list(dict.fromkeys(parsed))
+    if not parsed:
+        raise HTTPException(status_code=400, detail="ids must not be empty")
+    if len(parsed) > config.batch_max_ids:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {config.batch_max_ids} ids can be requested at once",
+        )
+    return parsed
+
+
+BatchIdsDep = Annotated[list[int], Depends(get_batch_ids)]
@@ -1,13 +1,71 @@
 from google.cloud import storage
+import google.auth
+from google.auth.transport.requests import AuthorizedSession, Request
+import requests
+from requests.adapters import HTTPAdapter
 from typing import Annotated
 from fastapi import Depends
+import threading
+
 from ..config import config
+from .local_storage import LocalBucket
+
+_lock = threading.RLock()
+_storage_client: storage.Client | None = None
+_bucket: storage.Bucket | LocalBucket | None = None
+
+
+def _pooled_session() -> tuple[AuthorizedSession, str | None]:
+    """
+    An authorized session with a sized connection pool, and the default project.
+
+    It is passed to `storage.Client(_http=...)`, the client's injection point
+    for its HTTP transport, instead of patching the session the client builds.
+    """
+    credentials, project = google.auth.default(scopes=storage.Client.SCOPE)
+    adapter = HTTPAdapter(
+        pool_connections=config.storage_pool_connections,
+        pool_maxsize=config.storage_pool_maxsize,
+        max_retries=config.storage_max_retries,
+    )
+    # Token refreshes go through their own session, give it the same pool
+    refresh_session = requests.Session()
+    refresh_session.mount("https://", adapter)
+    session = AuthorizedSession(
+        credentials, auth_request=Request(session=refresh_session)
+    )
+    session.mount("https://", adapter)
+    return session, project
+
+
+def get_storage_client() -> storage.Client:
+    """
+    Return the process-wide storage client, creating it on first use.
+
+    The client keeps a single authorized HTTP session whose connection pool is
+    shared by every request, so credentials are only read once per process.
+    """
+    global _storage_client
+    if _storage_client is None:
+        with _lock:
+            if _storage_client is None:
+                session, project = _pooled_session()
+                _storage_client = storage.Client(
+                    project=project, credentials=session.credentials, _http=session
+                )
+    return _storage_client
 
 
 def get_bucket():
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(config.bucket_name)
-    return bucket
+    global _bucket
+    if _bucket is None:
+        with _lock:
+            if _bucket is None:
+                if config.storage_backend == "local":
+                    _bucket = LocalBucket(config.local_storage_path, config.bucket_name)
+                else:
+                    _bucket = get_storage_client().bucket(config.bucket_name)
+    return _bucket
 
 
 BucketDep = Annotated[storage.Bucket, Depends(get_bucket)]
@@ -2,14 +2,16 @@ from sqlmodel import create_engine, Session
 from ..config import config
 from fastapi import Depends
 from typing import Annotated
-from google.cloud.sql.connector import Connector, IPTypes
-import pymysql
+import threading
 
 
 def connect_with_connector():
     """
     Initializes a connection pool for a Cloud SQL instance of MySQL.
     """
+    from google.cloud.sql.connector import Connector, IPTypes
+    import pymysql
+
     instance_connection_name = config.db_connection_name
     db_user = config.db_username
     db_pass = config.db_password
@@ -35,11 +37,23 @@ def connect_with_connector():
     return engine
 
 
-engine = connect_with_connector()
+# The connector starts a background event loop and talks to the Cloud SQL
+# admin API, so the engine is only created when the first session needs it
+_engine = None
+_lock = threading.Lock()
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _lock:
+            if _engine is None:
+                _engine = connect_with_connector()
+    return _engine
 
 
 def get_session():
-    with Session(engine) as session:
+    with Session(get_engine()) as session:
         yield session
 
 
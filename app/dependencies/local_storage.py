@@ -0,0 +1,86 @@
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import BinaryIO
+
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+
+class LocalBlob:
+    """Filesystem stand-in for `google.cloud.storage.Blob`."""
+
+    def __init__(self, bucket: "LocalBucket", name: str):
+        self.bucket = bucket
+        self.name = name
+        self.generation: int | None = None
+        self.content_type: str | None = None
+        self.chunk_size: int | None = None
+
+    @property
+    def path(self) -> Path:
+        return self.bucket.root / self.name
+
+    @property
+    def public_url(self) -> str:
+        return f"{self.bucket.base_url}/{self.name}"
+
+    def exists(self) -> bool:
+        return self.path.is_file()
+
+    def reload(self):
+        if not self.exists():
+            raise NotFound(f"No such object: {self.bucket.name}/{self.name}")
+        self.generation = self.path.stat().st_mtime_ns
+
+    def upload_from_file(
+        self,
+        file_obj: BinaryIO,
+        content_type: str | None = None,
+        if_generation_match: int | None = None,
+        **kwargs,
+    ):
+        with self.bucket.lock:
+            if if_generation_match == 0 and self.exists():
+                raise PreconditionFailed(
+                    f"Object already exists: {self.bucket.name}/{self.name}"
+                )
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "wb") as fd:
+                shutil.copyfileobj(file_obj, fd, self.chunk_size or 1024 * 1024)
+        self.content_type = content_type
+        self.reload()
+
+    def delete(self, if_generation_match: int | None = None, **kwargs):
+        with self.bucket.lock:
+            self.reload()
+            if (
+                if_generation_match is not None
+                and if_generation_match != self.generation
+            ):
+                raise PreconditionFailed(
+                    f"Generation mismatch: {self.bucket.name}/{self.name}"
+                )
+            os.remove(self.path)
+
+
+class LocalBucket:
+    """
+    Filesystem stand-in for `google.cloud.storage.Bucket`.
+
+    Blobs are stored under `root` using their object name as relative path, so
+    tests and benchmarks can exercise the upload and delete paths without
+    network access or credentials.
+    """
+
+    def __init__(self, root: str, name: str, base_url: str | None = None):
+        self.root = Path(root)
+        self.name = name
+        self.base_url = base_url or self.root.resolve().as_uri()
+        self.lock = threading.Lock()
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def blob(self, blob_name: str, chunk_size: int | None = None) -> LocalBlob:
+        blob = LocalBlob(self, blob_name)
+        blob.chunk_size = chunk_size
+        return blob
@@ -0,0 +1,61 @@
+from typing import Annotated
+
+from fastapi import Depends, HTTPException, Query
+from pydantic import BaseModel
+
+from ..response_models import SongPublic, SongRefPublic
+
+SONG_INCLUDES = {"users", "albums"}
+
+
+class SongListOptions(BaseModel):
+    fields: set[str] | None = None
+    include: set[str] = set()
+
+
+def _split(value: str | None) -> set[str]:
+    if value is None:
+        return set()
+    return {item.strip() for item in value.split(",") if item.strip()}
+
+
+def get_song_list_options(
+    fields: Annotated[
+        str | None,
+        Query(
+            description="Comma-separated song attributes to return, e.g. `id,name,song_url`"
+        ),
+    ] = None,
+    include: Annotated[
+        str | None,
+        Query(
+            description="Comma-separated side-loads (`users`, `albums`). Songs then "
+            "reference them by `singer_id` / `album_id` instead of embedding them"
+        ),
+    ] = None,
+) -> SongListOptions:
+    includes = _split(include)
+    unknown = includes - SONG_INCLUDES
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid include: {', '.join(sorted(unknown))}. "
+            f"Allowed: {', '.join(sorted(SONG_INCLUDES))}",
+        )
+
+    if fields is None:
+        return SongListOptions(include=includes)
+
+    allowed = set((SongRefPublic if includes else SongPublic).model_fields)
+    requested = _split(fields)
+    unknown = requested - allowed
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid fields: {', '.join(sorted(unknown))}. "
+            f"Allowed: {', '.join(sorted(allowed))}",
+        )
+    return SongListOptions(fields=requested | {"id"}, include=includes)
+
+
+SongListOptionsDep = Annotated[SongListOptions, Depends(get_song_list_options)]
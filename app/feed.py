@@ -0,0 +1,166 @@
+"""
+Home timelines materialized on write.
+
+When a post is created it is copied into a `Feed_Entries` row for every
+follower of the author with one `INSERT ... SELECT` over `Follows`. Reading a
+page is then a limited range scan of `(user_id, created_at)` instead of one
+query per followed account. Timelines are kept to `feed_max_entries` rows.
+They are trimmed lazily, when the owner reads the first page and the timeline
+has grown `feed_trim_slack` past the cap, so writing a post never touches the
+followers' existing entries.
+
+Authors with more than `feed_fanout_max_followers` followers are not fanned
+out. Their posts are merged in when the feed is read instead (fan-out on
+read), with one limited query per such author, which keeps one post from
+writing millions of rows.
+"""
+
+from sqlalchemy import delete, exists, insert, literal
+from sqlalchemy.orm import selectinload
+from sqlmodel import Session, col, select
+
+from .config import config
+from .models import Feed_Entries, Follows, Posts, Users
+
+
+def is_fanned_out(author: Users) -> bool:
+    return author.follower_count <= config.feed_fanout_max_followers
+
+
+def fan_out_post(session: Session, post: Posts, author: Users):
+    """Add `post` to the timelines of the author's followers."""
+    if not is_fanned_out(author):
+        return
+    followers = select(
+        Follows.follower_id,
+        literal(post.id),
+        literal(post.user_id),
+        literal(post.created_at),
+    ).where(Follows.user_id == post.user_id)
+    session.execute(
+        insert(Feed_Entries).from_select(
+            ["user_id", "post_id", "author_id", "created_at"], followers
+        )
+    )
+
+
+def _timeline_entry_at(session: Session, user_id: int, offset: int):
+    """`created_at` of the entry at `offset` from the newest, or None."""
+    return session.exec(
+        select(Feed_Entries.created_at)
+        .where(Feed_Entries.user_id == user_id)
+        .order_by(Feed_Entries.created_at.desc())
+        .offset(offset)
+        .limit(1)
+    ).one_or_none()
+
+
+def trim_timeline(session: Session, user_id: int) -> bool:
+    """
+    Cut the timeline back to `feed_max_entries` once it outgrew the cap plus
+    the slack; returns whether anything was deleted.
+
+    Both lookups are bounded index range scans on `(user_id, created_at)`.
+    """
+    overflow = config.feed_max_entries + config.feed_trim_slack
+    if _timeline_entry_at(session, user_id, overflow) is None:
+        return False
+    cutoff = _timeline_entry_at(session, user_id, config.feed_max_entries - 1)
+    session.execute(
+        delete(Feed_Entries)
+        .where(Feed_Entries.user_id == user_id, Feed_Entries.created_at < cutoff)
+        .execution_options(synchronize_session=False)
+    )
+    return True
+
+
+def remove_post(session: Session, post_id: int):
+    session.execute(
+        delete(Feed_Entries)
+        .where(Feed_Entries.post_id == post_id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def backfill_author(session: Session, follower_id: int, author: Users):
+    """Copy the newest posts of a newly followed author into the follower's feed."""
+    if not is_fanned_out(author):
+        return
+    already_in_feed = exists().where(
+        Feed_Entries.user_id == follower_id, Feed_Entries.post_id == Posts.id
+    )
+    recent_posts = (
+        select(literal(follower_id), Posts.id, Posts.user_id, Posts.created_at)
+        .where(Posts.user_id == author.id, ~already_in_feed)
+        .order_by(Posts.created_at.desc())
+        .limit(config.feed_backfill_posts)
+    )
+    session.execute(
+        insert(Feed_Entries).from_select(
+            ["user_id", "post_id", "author_id", "created_at"], recent_posts
+        )
+    )
+    trim_timeline(session, follower_id)
+
+
+def remove_author(session: Session, follower_id: int, author_id: int):
+    session.execute(
+        delete(Feed_Entries)
+        .where(Feed_Entries.user_id == follower_id, Feed_Entries.author_id == author_id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def read_feed(session: Session, user_id: int, offset: int, limit: int) -> list[Posts]:
+    """
+    One page of the user's timeline, newest first.
+
+    The newest `offset + limit` materialized entries come from the
+    `(user_id, created_at)` index, and as many posts of each followed author
+    that is not fanned out come from `(user_id, created_at)` on `Posts`. The
+    candidates are merged by post id, so a post appears once even if an author
+    crossed the threshold after it was fanned out, and only the page is loaded.
+    """
+    if offset >= config.feed_max_entries:
+        return []
+    window = min(offset + limit, config.feed_max_entries)
+
+    candidates = dict(
+        session.exec(
+            select(Feed_Entries.post_id, Feed_Entries.created_at)
+            .where(Feed_Entries.user_id == user_id)
+            .order_by(Feed_Entries.created_at.desc(), Feed_Entries.post_id.desc())
+            .limit(window)
+        ).all()
+    )
+    pulled_authors = session.exec(
+        select(Follows.user_id)
+        .join(Users, Users.id == Follows.user_id)
+        .where(
+            Follows.follower_id == user_id,
+            Users.follower_count > config.feed_fanout_max_followers,
+        )
+    ).all()
+    for author_id in pulled_authors:
+        candidates.update(
+            session.exec(
+                select(Posts.id, Posts.created_at)
+                .where(Posts.user_id == author_id)
+                .order_by(Posts.created_at.desc(), Posts.id.desc())
+                .limit(window)
+            ).all()
+        )
+
+    newest = sorted(
+        candidates.items(), key=lambda item: (item[1], item[0]), reverse=True
+    )
+    page = [post_id for post_id, _ in newest[offset:window]]
+    if not page:
+        return []
+    posts = session.exec(
+        select(Posts)
+        .where(col(Posts.id).in_(page))
+        .options(selectinload(Posts.user))
+    ).all()
+    by_id = {post.id: post for post in posts}
+    return [by_id[post_id] for post_id in page if post_id in by_id]
@@ -0,0 +1,85 @@
+"""
+HTTP validators (ETag / Last-Modified) and Cache-Control for public reads.
+
+Validators are derived from the `updated_at` columns of the entity (and, for
+albums and playlists, of the songs they contain), so a handler can answer a
+conditional request with a single indexed lookup, or straight from the entity
+cache, without building the response body.
+"""
+
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+import hashlib
+
+from fastapi import Request, Response
+
+from .cache import CachedEntity
+from .config import config
+
+
+def as_utc(value: datetime) -> datetime:
+    # MySQL returns naive datetimes; they are stored in UTC
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def make_etag(kind: str, id: int, *versions) -> str:
+    version = "|".join(
+        as_utc(v).isoformat() if isinstance(v, datetime) else str(v)
+        for v in versions
+    )
+    digest = hashlib.sha1(f"{kind}:{id}:{version}".encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def has_validators(request: Request) -> bool:
+    return (
+        "if-none-match" in request.headers or "if-modified-since" in request.headers
+    )
+
+
+def is_not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison, as required for If-None-Match
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in candidates or etag.removeprefix("W/") in candidates
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return as_utc(last_modified).replace(microsecond=0) <= since
+
+    return False
+
+
+def caching_headers(etag: str, last_modified: datetime) -> dict[str, str]:
+    return {
+        "ETag": etag,
+        "Last-Modified": format_datetime(as_utc(last_modified), usegmt=True),
+        "Cache-Control": (
+            f"public, max-age={config.http_cache_max_age}, "
+            f"stale-while-revalidate={config.http_cache_stale_while_revalidate}"
+        ),
+    }
+
+
+def not_modified_response(etag: str, last_modified: datetime) -> Response:
+    return Response(status_code=304, headers=caching_headers(etag, last_modified))
+
+
+def entity_response(request: Request, entity: CachedEntity) -> Response:
+    """Serve a cached entity, or 304 if the client already has this version."""
+    if is_not_modified(request, entity.etag, entity.last_modified):
+        return not_modified_response(entity.etag, entity.last_modified)
+    return Response(
+        content=entity.body,
+        media_type="application/json",
+        headers=caching_headers(entity.etag, entity.last_modified),
+    )
@@ -0,0 +1,90 @@
+"""
+Build the "similar songs" index from the item embeddings of the recommender.
+
+Usage:
+    python -m app.jobs.build_similar_songs [--model-dir DIR] [--output DIR]
+        [--lists N] [--iterations 20]
+
+Embeddings are read from the NumPy weight export (`gru4rec_weights`) when it
+exists, otherwise from `gru4rec_model.keras`, which needs TensorFlow. Row `i`
+of the embedding is the song encoder class `i`, so every indexed vector is
+stored with that class, the `ml_id` of `Songs`. The index is written to a
+new directory and `--output` is switched to it atomically, so the job can run
+while workers serve the old index; they pick up the new one on restart.
+"""
+
+import argparse
+import logging
+import os
+import time
+
+import joblib
+import numpy as np
+
+from ..config import config
+from ..model_registry import EXPORTED_MODELS_DIR
+from ..similar_songs import INDEX_DIR, IVFIndex
+
+logger = logging.getLogger(__name__)
+
+
+def item_embeddings(model_dir: str) -> np.ndarray:
+    weights = os.path.join(model_dir, "gru4rec_weights", "item_embedding.npy")
+    if os.path.exists(weights):
+        # A reduced-precision export has per-row scales, which normalization
+        # cancels out, so the stored values can be used as they are
+        return np.load(weights).astype(np.float32)
+
+    from ..ml.ml_models.models import load_model
+
+    model = load_model(os.path.join(model_dir, "gru4rec_model.keras"))
+    return np.asarray(model.embedding.embeddings.numpy(), dtype=np.float32)
+
+
+def build_similar_songs(
+    model_dir: str,
+    output: str,
+    n_lists: int | None = None,
+    iterations: int = 20,
+) -> IVFIndex:
+    embeddings = item_embeddings(model_dir)
+    encoder = joblib.load(os.path.join(model_dir, "song_encoder.pkl"))
+    ml_ids = [str(ml_id) for ml_id in encoder.classes_]
+    if len(ml_ids) != len(embeddings):
+        logger.warning(
+            "%d encoder classes for %d embedding rows; indexing the common prefix",
+            len(ml_ids),
+            len(embeddings),
+        )
+    size = min(len(ml_ids), len(embeddings))
+
+    start = time.perf_counter()
+    index = IVFIndex.build(embeddings[:size], ml_ids[:size], n_lists, iterations)
+    index.save(output)
+    logger.info(
+        "Indexed %d songs in %d lists in %.1fs",
+        size,
+        len(index.centroids),
+        time.perf_counter() - start,
+    )
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--model-dir", default=config.recommender_model_dir or EXPORTED_MODELS_DIR
+    )
+    parser.add_argument("--output", default=INDEX_DIR)
+    parser.add_argument("--lists", type=int, default=None)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    index = build_similar_songs(
+        args.model_dir, args.output, args.lists, args.iterations
+    )
+    print(f"{len(index.vectors)} songs indexed in {len(index.centroids)} lists")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Precompute recommendations for recently active users.
+
+Usage:
+    python -m app.jobs.precompute_recommendations [--processes N]
+        [--chunk-size 500] [--active-days 1] [--count 10]
+
+Users with a play in the last `active_days` are walked in id order,
+`chunk_size` at a time. For each chunk, one query reads the histories of
+every user with `recent_histories`, which the online endpoint uses too. The
+chunk then goes to a process pool, where each worker has loaded the model
+once and scores the whole chunk in one batched model call. Only a few chunks are in flight at a time, so memory
+stays flat however many users are active.
+
+The results replace each user's rows in `User_Recommendations`, stamped with
+the start time of the run. `GET /songs/recommendations` serves them while
+they are younger than `recommendations_max_age_hours`. Users whose history
+cannot be encoded keep their old rows, which then age out.
+
+Workers are spawned rather than forked, because TensorFlow is not fork-safe.
+Size each worker's TensorFlow pools with `TF_INTRA_OP_THREADS`, or use
+`RECOMMENDER_BACKEND=numpy`.
+"""
+
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+import logging
+import multiprocessing
+import os
+import time
+from typing import Iterator
+
+from sqlalchemy import delete, insert
+from sqlmodel import Session, col, select
+
+from ..config import config
+from ..dependencies.db import get_engine
+from ..listening_history import recent_histories
+from ..models import Histories, Songs, User_Recommendations
+
+logger = logging.getLogger(__name__)
+
+_recommender = None
+
+
+def active_user_ids(
+    session: Session, since: datetime, chunk_size: int
+) -> Iterator[list[int]]:
+    last_id = 0
+    while True:
+        user_ids = session.exec(
+            select(Histories.user_id)
+            .where(Histories.created_at >= since, Histories.user_id > last_id)
+            .group_by(Histories.user_id)
+            .order_by(Histories.user_id)
+            .limit(chunk_size)
+        ).all()
+        if not user_ids:
+            return
+        yield list(user_ids)
+        last_id = user_ids[-1]
+
+
+def _init_worker():
+    global _recommender
+    from ..model_registry import (
+        ModelRegistry,
+        configure_tensorflow_threads,
+        pin_current_thread,
+    )
+
+    pin_current_thread()
+    if config.recommender_backend != "numpy":
+        configure_tensorflow_threads()
+    _recommender = ModelRegistry().load()
+
+
+def _recommend_chunk(
+    histories: dict[int, tuple[list[str], list[list[str]]]], count: int
+) -> dict[int, list[str]]:
+    user_ids = list(histories)
+    results = _recommender.recommend_batch(
+        [histories[user_id] for user_id in user_ids], count
+    )
+    return {
+        user_id: ml_ids for user_id, ml_ids in zip(user_ids, results) if ml_ids
+    }
+
+
+def store_recommendations(
+    session: Session, recommendations: dict[int, list[str]], generated_at: datetime
+) -> int:
+    """Replace the rows of these users; returns the number of users written."""
+    if not recommendations:
+        return 0
+    ml_ids = {ml_id for ml_ids in recommendations.values() for ml_id in ml_ids}
+    song_ids = dict(
+        session.exec(
+            select(Songs.ml_id, Songs.id).where(col(Songs.ml_id).in_(ml_ids))
+        ).all()
+    )
+
+    rows = []
+    for user_id, ml_ids in recommendations.items():
+        known = [song_ids[ml_id] for ml_id in ml_ids if ml_id in song_ids]
+        rows.extend(
+            {
+                "user_id": user_id,
+                "position": position,
+                "song_id": song_id,
+                "generated_at": generated_at,
+            }
+            for position, song_id in enumerate(known)
+        )
+    session.execute(
+        delete(User_Recommendations).where(
+            col(User_Recommendations.user_id).in_(list(recommendations))
+        )
+    )
+    if rows:
+        session.execute(insert(User_Recommendations), rows)
+    session.commit()
+    return len(recommendations)
+
+
+def precompute_recommendations(
+    count: int,
+    processes: int | None = None,
+    chunk_size: int | None = None,
+    active_days: int | None = None,
+) -> int:
+    """Returns the number of users whose recommendations were written."""
+    processes = processes or config.recommendations_batch_processes or os.cpu_count()
+    chunk_size = chunk_size or config.recommendations_batch_chunk_size
+    active_days = active_days or config.recommendations_active_days
+    generated_at = datetime.now(timezone.utc)
+    since = generated_at - timedelta(days=active_days)
+
+    stored = 0
+    pending = set()
+    pool = ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+    )
+    with pool, Session(get_engine()) as session:
+
+        def store(done):
+            nonlocal stored
+            for future in done:
+                stored += store_recommendations(session, future.result(), generated_at)
+            logger.info("%d users written", stored)
+
+        for user_ids in active_user_ids(session, since, chunk_size):
+            histories = recent_histories(session, user_ids)
+            if histories:
+                pending.add(pool.submit(_recommend_chunk, histories, count))
+            if len(pending) >= 2 * processes:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                store(done)
+        store(wait(pending).done)
+    return stored
+
+
+def main():
+    from ..routers.recommendations import RECOMMENDATION_COUNT
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=RECOMMENDATION_COUNT)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=None)
+    parser.add_argument("--active-days", type=int, default=None)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    start = time.perf_counter()
+    stored = precompute_recommendations(
+        args.count, args.processes, args.chunk_size, args.active_days
+    )
+    print(f"{stored} users written in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Recompute denormalized counters from their source tables and repair drift.
+
+Usage:
+    python -m app.jobs.reconcile_counters [--chunk-size 1000]
+
+Rows are walked in primary-key order one chunk per transaction. For each chunk
+the stored counters are compared with a grouped count of `Song_Likes`,
+`Post_Likes` or `Follows`, and only rows that differ are rewritten. The
+rewrite recomputes the count inside the `UPDATE`, so a like that lands while
+the job runs is not lost.
+"""
+
+import argparse
+import logging
+from typing import NamedTuple
+
+from sqlmodel import Session, func, select
+from sqlalchemy import update
+
+from ..cache import entity_cache
+from ..config import config
+from ..dependencies.db import get_engine
+from ..models import Follows, Post_Likes, Posts, Song_Likes, Songs, Users
+
+logger = logging.getLogger(__name__)
+
+
+class Counter(NamedTuple):
+    column: object
+    source: object
+    cache_kind: str | None = None
+
+
+COUNTERS = [
+    Counter(Songs.like_count, Song_Likes.song_id, "song"),
+    Counter(Posts.like_count, Post_Likes.post_id, "post"),
+    Counter(Users.follower_count, Follows.user_id),
+    Counter(Users.following_count, Follows.follower_id),
+]
+
+
+def reconcile_counter(session: Session, counter: Counter, chunk_size: int) -> int:
+    """Repair one counter column; returns the number of rows fixed."""
+    model = counter.column.class_
+    repaired = 0
+    last_id = 0
+    while True:
+        rows = session.exec(
+            select(model.id, counter.column)
+            .where(model.id > last_id)
+            .order_by(model.id)
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        ids = [row[0] for row in rows]
+        actual = dict(
+            session.exec(
+                select(counter.source, func.count())
+                .where(counter.source.in_(ids))
+                .group_by(counter.source)
+            ).all()
+        )
+        drifted = [id for id, stored in rows if stored != actual.get(id, 0)]
+        if drifted:
+            recount = (
+                select(func.count())
+                .where(counter.source == model.id)
+                .scalar_subquery()
+            )
+            session.execute(
+                update(model)
+                .where(model.id.in_(drifted))
+                .values({counter.column: recount})
+                .execution_options(synchronize_session=False)
+            )
+            repaired += len(drifted)
+        session.commit()
+        if drifted and counter.cache_kind is not None:
+            entity_cache.invalidate(counter.cache_kind, *drifted)
+    return repaired
+
+
+def reconcile_counters(session: Session, chunk_size: int | None = None) -> dict[str, int]:
+    chunk_size = chunk_size or config.counter_reconcile_chunk_size
+    repaired = {}
+    for counter in COUNTERS:
+        name = f"{counter.column.class_.__name__}.{counter.column.key}"
+        repaired[name] = reconcile_counter(session, counter, chunk_size)
+        logger.info("%s: repaired %d rows", name, repaired[name])
+    return repaired
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunk-size", type=int, default=None)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    with Session(get_engine()) as session:
+        repaired = reconcile_counters(session, args.chunk_size)
+    for name, count in repaired.items():
+        print(f"{name}: {count} rows repaired")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Idempotent like / unlike as a single statement batch.
+
+`add_like` inserts the like row with `INSERT IGNORE ... SELECT` from the liked
+table, so a missing target and an existing like both simply insert nothing,
+and bumps the counter only when a row was actually inserted. `remove_like`
+deletes and decrements the same way. No row is read before it is written, and
+two identical requests racing each other change the counter once.
+"""
+
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, exists, insert, literal
+from sqlmodel import Session, select
+
+from .counters import increment
+
+
+def add_like(
+    session: Session, like_model, target_column, counter, user_id: int, target_id: int
+) -> bool:
+    """
+    Like `target_id` for `user_id`; returns False if nothing changed.
+
+    `target_column` is the like table's foreign key (e.g. `Song_Likes.song_id`)
+    and `counter` the counter column of the liked table.
+    """
+    target = counter.class_
+    columns = {"user_id": literal(user_id), target_column.key: target.id}
+    if "created_at" in like_model.__table__.columns:
+        columns["created_at"] = literal(datetime.now(timezone.utc))
+    target_row = select(*columns.values()).where(target.id == target_id)
+    result = session.execute(
+        insert(like_model)
+        .from_select(list(columns), target_row)
+        .prefix_with("IGNORE", dialect="mysql")
+        .prefix_with("OR IGNORE", dialect="sqlite")
+    )
+    if result.rowcount:
+        increment(session, counter, target_id)
+    return bool(result.rowcount)
+
+
+def remove_like(
+    session: Session, like_model, target_column, counter, user_id: int, target_id: int
+) -> bool:
+    """Remove the like if there is one; returns False if nothing changed."""
+    result = session.execute(
+        delete(like_model)
+        .where(like_model.user_id == user_id, target_column == target_id)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
+        increment(session, counter, target_id, -1)
+    return bool(result.rowcount)
+
+
+def target_exists(session: Session, model, target_id: int) -> bool:
+    return session.exec(select(exists().where(model.id == target_id))).one()
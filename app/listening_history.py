@@ -0,0 +1,50 @@
+"""
+Listening histories fed to the recommender.
+
+`GET /songs/recommendations` and the `precompute_recommendations` job read
+histories through `recent_histories`, so a user gets the same recommendations
+whether they were precomputed or scored online.
+"""
+
+from sqlmodel import Session, col, func, select
+
+from .models import Histories, Songs
+
+# Plays per history
+HISTORY_LENGTH = 10
+
+
+def recent_histories(
+    session: Session, user_ids: list[int]
+) -> dict[int, tuple[list[str], list[list[str]]]]:
+    """
+    `(ml_ids, genres)` of the latest `HISTORY_LENGTH` plays of each user, oldest
+    first. Plays of songs the model does not know (no `ml_id`) are skipped, so
+    both lists always have the same length. Users without such plays are
+    missing from the result.
+    """
+    ranked = (
+        select(
+            Histories.user_id,
+            Histories.song_id,
+            Histories.created_at,
+            func.row_number()
+            .over(partition_by=Histories.user_id, order_by=Histories.created_at.desc())
+            .label("rank"),
+        )
+        .where(col(Histories.user_id).in_(user_ids))
+        .subquery()
+    )
+    rows = session.exec(
+        select(ranked.c.user_id, Songs.ml_id, Songs.genre)
+        .join(Songs, Songs.id == ranked.c.song_id)
+        .where(ranked.c.rank <= HISTORY_LENGTH, col(Songs.ml_id).is_not(None))
+        .order_by(ranked.c.user_id, ranked.c.created_at)
+    ).all()
+
+    histories = {}
+    for user_id, ml_id, genre in rows:
+        song_ml_ids, genres = histories.setdefault(user_id, ([], []))
+        song_ml_ids.append(ml_id)
+        genres.append(genre.split(", "))
+    return histories
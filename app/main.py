@@ -1,4 +1,6 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from .routers import (
     auth,
     users,
@@ -8,15 +10,34 @@ from .routers import (
     posts,
     comments,
     recommendations,
+    feed,
+    health,
 )
 from .config import config
+from .blob_deletion import blob_deletion_worker
+from .model_registry import model_registry
 import os
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    blob_deletion_worker.start()
+    model_registry.start()
+    yield
+    model_registry.stop()
+    blob_deletion_worker.stop()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# With `gunicorn --preload` this runs once in the master, before the fork
+if config.model_preload:
+    model_registry.preload()
 
 if config.google_application_credentials is not None:
     os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = config.google_application_credentials
 
+app.include_router(health.router)
 app.include_router(auth.router)
 app.include_router(users.router)
 app.include_router(recommendations.router)
@@ -25,6 +46,7 @@ app.include_router(playlists.router)
 app.include_router(albums.router)
 app.include_router(posts.router)
 app.include_router(comments.router)
+app.include_router(feed.router)
 
 
 @app.get("/")
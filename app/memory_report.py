@@ -0,0 +1,96 @@
+"""
+Resident and shared memory of a server process and its workers (Linux only).
+
+Usage:
+    python -m app.memory_report [--pid PID] [--json]
+
+Reads `/proc/<pid>/smaps_rollup` for the given process (default: this one)
+and every descendant. `pss` charges each shared page to its sharers in equal
+parts, so the `pss` column sums to what the pod actually uses. `shared` is
+the part of `rss` that other processes also map. With
+`recommender_backend="numpy"`, the memory-mapped weights show up as shared
+clean pages in every worker.
+"""
+
+import argparse
+import json
+import os
+
+FIELDS = (
+    "Rss",
+    "Pss",
+    "Shared_Clean",
+    "Shared_Dirty",
+    "Private_Clean",
+    "Private_Dirty",
+)
+
+
+def children(pid: int) -> list[int]:
+    result = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        try:
+            with open(f"/proc/{pid}/task/{task}/children") as fd:
+                result.extend(int(child) for child in fd.read().split())
+        except OSError:
+            continue
+    return result
+
+
+def process_tree(pid: int) -> list[int]:
+    pids = [pid]
+    for child in children(pid):
+        pids.extend(process_tree(child))
+    return pids
+
+
+def memory_usage(pid: int) -> dict:
+    """The `FIELDS` of `smaps_rollup` in MiB, plus the command line."""
+    usage = {"pid": pid}
+    with open(f"/proc/{pid}/cmdline", "rb") as fd:
+        usage["cmd"] = fd.read().replace(b"\0", b" ").decode(errors="replace")[:60]
+    with open(f"/proc/{pid}/smaps_rollup") as fd:
+        for line in fd:
+            name, _, value = line.partition(":")
+            if name in FIELDS:
+                usage[name.lower()] = round(int(value.split()[0]) / 1024, 1)
+    usage["shared"] = round(usage["shared_clean"] + usage["shared_dirty"], 1)
+    usage["private"] = round(usage["private_clean"] + usage["private_dirty"], 1)
+    return usage
+
+
+def report(pid: int) -> list[dict]:
+    rows = []
+    for process in process_tree(pid):
+        try:
+            rows.append(memory_usage(process))
+        except OSError:
+            # The process exited while the tree was walked
+            continue
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pid", type=int, default=os.getpid())
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    rows = report(args.pid)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    print("Memory in MiB")
+    print(f"{'pid':>8} {'rss':>9} {'pss':>9} {'shared':>9} {'private':>9}  cmd")
+    for row in rows:
+        print(
+            f"{row['pid']:>8} {row['rss']:>9} {row['pss']:>9} "
+            f"{row['shared']:>9} {row['private']:>9}  {row['cmd']}"
+        )
+    total_pss = sum(row["pss"] for row in rows)
+    print(f"{len(rows)} processes, total pss {total_pss:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -61,7 +61,6 @@ class GRU4REC(Model):
         self.feature_dense_units = feature_dense_units
         self.items_size = items_size
         self.genres_size = genres_size
-        self.input_shape = None
 
         print(f"items size: {items_size}")
         print(f"genres size: {genres_size}")
@@ -107,13 +106,24 @@ class GRU4REC(Model):
         Forward pass for the GRU4REC model.
         :param inputs: Tuple (item_sequences, item_features, item_genres)
         :param training: Boolean indicating if the model is in training mode
+        :return: Item logits for every position, (batch, sequence, items_size)
         """
+        return self.item_head(self.encode(inputs, training), training)
+
+    def call_last_position(self, inputs):
+        """
+        Inference-only forward pass that scores the next item after the history.
+
+        The output layer (`ffn_1` and `item_output`, the largest matmul) runs on
+        the final hidden state only instead of on every position.
+        :return: Item logits for the last position, (batch, items_size)
+        """
+        return self.item_head(self.encode(inputs)[:, -1, :])
+
+    def encode(self, inputs, training=False):
+        """Hidden state of the RNN stack at every position."""
         item_sequences, _, item_genres = inputs
 
-        # Update input shape dynamically
-        if self.input_shape is None:
-            # Set the input shape based on the first batch of inputs
-            self.input_shape = item_sequences.shape
         encoding_padding_mask = tf.math.logical_not(tf.math.equal(item_sequences, 0))
 
         # print("Item Sequence Shape:", item_sequences.shape)
@@ -167,7 +177,10 @@ class GRU4REC(Model):
         # print(f"Shape before squeeze: {x.shape}")
         # x = tf.squeeze(x, axis=1)
         # print(f"Shape before softmax: {x.shape}")
+        return x
 
+    def item_head(self, x, training=False):
+        """Item logits for the hidden states `x`."""
         x = self.ffn1(x)
         x = self.dropout(x, training=training)
         x = self.activation1(x)
@@ -0,0 +1,368 @@
+"""
+TensorFlow-free inference over memory-mapped weights.
+
+`export_weights` writes every GRU4REC weight to its own `.npy` file. It also
+writes a manifest with the few hyper-parameters the forward pass needs.
+`NumpyServing` maps those files read-only (`np.load(mmap_mode="r")`) and runs
+the same inference graph in NumPy. Weight pages therefore live in the page
+cache and are shared by every worker on the host. When the app is preloaded
+in a pre-fork master, workers also inherit the mappings. Workers on this
+backend never import TensorFlow, whose runtime is the bulk of a worker's
+private memory.
+
+The two matrices that grow with the catalog, the item embedding and the
+`item_output` kernel, can be stored in reduced precision (`--precision`).
+`float16` halves them. `int8` quarters them, with one float32 scale per item.
+NumPy multiplies in float32 only, so a reduced-precision `item_output` kernel
+is converted `ITEM_BLOCK` item columns at a time and each block's scales are
+applied to its logits. The float32 temporary stays that size instead of the
+whole catalog; the multiplication itself costs the same as in float32.
+
+Every export goes to a new `gru4rec_weights.<version>` directory, and
+`gru4rec_weights` is a symlink that is swapped to it atomically
+(`publish_directory`). Files that workers have mapped are never rewritten.
+
+Export (needs TensorFlow once, checks NumPy against Keras on random input):
+    python -m app.ml.ml_models.numpy_serving [--model path.keras] [--output dir]
+        [--precision float32|float16|int8]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+SEQUENCE_LENGTH = 15
+GENRES_PER_ITEM = 15
+MAX_RECOMMENDATIONS = 50
+
+EXPORTED_MODELS_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "exported_models"
+)
+WEIGHTS_DIR = os.path.join(EXPORTED_MODELS_DIR, "gru4rec_weights")
+
+PRECISIONS = ("float32", "float16", "int8")
+# Item columns of a reduced-precision output kernel converted to float32 at once
+ITEM_BLOCK = 4096
+# Matrix name -> axis that indexes items (the embedding has one row per item,
+# the output kernel one column per item)
+ITEM_MATRICES = {"item_embedding": 0, "item_output.kernel": 1}
+
+
+def publish_directory(directory: str, write) -> str:
+    """
+    Write a new version of `directory` with `write(path)` and switch to it.
+
+    `directory` is a symlink to a sibling `<name>.<version>` directory and is
+    swapped with `os.replace`, which is atomic. Files are never rewritten in
+    place: workers map them with `mmap_mode="r"`, and truncating a mapped
+    file makes their next page fault past the new end raise SIGBUS. The
+    previous version is kept for loaders that resolved the link just before
+    the swap; older ones are removed, and processes that still map them keep
+    reading the unlinked files until they reload. Returns the new version.
+    """
+    directory = os.path.abspath(directory)
+    parent, name = os.path.split(directory)
+    os.makedirs(parent, exist_ok=True)
+    version = tempfile.mkdtemp(
+        prefix=f"{name}.{time.strftime('%Y%m%d%H%M%S')}.", dir=parent
+    )
+    try:
+        write(version)
+    except BaseException:
+        shutil.rmtree(version)
+        raise
+    # mkdtemp creates the directory private to this user
+    os.chmod(version, 0o755)
+
+    previous = None
+    if os.path.islink(directory):
+        previous = os.path.realpath(directory)
+    elif os.path.isdir(directory):
+        # Written before exports were versioned: moved aside once, which
+        # leaves a short window without `directory`
+        previous = tempfile.mkdtemp(prefix=f"{name}.", dir=parent)
+        os.replace(directory, previous)
+    link = f"{directory}.{os.getpid()}.link"
+    os.symlink(os.path.basename(version), link)
+    os.replace(link, directory)
+
+    for entry in os.listdir(parent):
+        path = os.path.join(parent, entry)
+        if (
+            entry.startswith(f"{name}.")
+            and path not in (version, previous)
+            and os.path.isdir(path)
+            and not os.path.islink(path)
+        ):
+            shutil.rmtree(path)
+    return version
+
+
+def _sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+def pad_history(item_sequence, genres_sequence) -> tuple[np.ndarray, np.ndarray]:
+    """NumPy port of `preprocessing.process_sequences`, batch axis of 1."""
+    items = np.zeros((1, SEQUENCE_LENGTH), dtype=np.int32)
+    if len(item_sequence):
+        items[0, -len(item_sequence) :] = item_sequence
+    genres = np.zeros((1, SEQUENCE_LENGTH, GENRES_PER_ITEM), dtype=np.int32)
+    for i, genre_row in enumerate(genres_sequence[:SEQUENCE_LENGTH]):
+        genre_row = np.asarray(genre_row)[:GENRES_PER_ITEM]
+        genres[0, i, : len(genre_row)] = genre_row
+    return items, genres
+
+
+def quantize(
+    weights: dict[str, np.ndarray], precision: str
+) -> tuple[dict[str, np.ndarray], dict[str, str]]:
+    """
+    Store `ITEM_MATRICES` in `precision`.
+
+    Returns the new weights and the `{name: precision}` map recorded in the
+    manifest. `int8` uses symmetric per-item scales, saved as `<name>.scale`.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"precision must be one of {', '.join(PRECISIONS)}")
+    weights = dict(weights)
+    if precision == "float32":
+        return weights, {}
+
+    for name, item_axis in ITEM_MATRICES.items():
+        matrix = np.asarray(weights[name], dtype=np.float32)
+        if precision == "float16":
+            weights[name] = matrix.astype(np.float16)
+            continue
+        scale = np.abs(matrix).max(axis=1 - item_axis) / 127
+        scale[scale == 0] = 1
+        quantized = np.round(matrix / np.expand_dims(scale, 1 - item_axis))
+        weights[name] = quantized.clip(-127, 127).astype(np.int8)
+        weights[f"{name}.scale"] = scale.astype(np.float32)
+    return weights, dict.fromkeys(ITEM_MATRICES, precision)
+
+
+class NumpyServing:
+    def __init__(
+        self, weights: dict[str, np.ndarray], manifest: dict, logits_mode: str
+    ):
+        self.weights = weights
+        self.manifest = manifest
+        self.logits_mode = logits_mode
+        self.precision = manifest.get("precision", {})
+
+    @classmethod
+    def load(cls, directory: str = WEIGHTS_DIR, logits_mode: str = "positions"):
+        # Resolve the link once, so a concurrent export cannot mix versions
+        directory = os.path.realpath(directory)
+        with open(os.path.join(directory, "manifest.json")) as fd:
+            manifest = json.load(fd)
+        weights = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+            for name in manifest["weights"]
+        }
+        return cls(weights, manifest, logits_mode)
+
+    def _gru(self, prefix: str, x: np.ndarray) -> np.ndarray:
+        """Keras GRU with reset_after=True, tanh / sigmoid, return_sequences=True."""
+        kernel = self.weights[f"{prefix}.kernel"]
+        recurrent_kernel = self.weights[f"{prefix}.recurrent_kernel"]
+        input_bias, recurrent_bias = self.weights[f"{prefix}.bias"]
+        units = recurrent_kernel.shape[0]
+
+        x_proj = x @ kernel + input_bias  # all timesteps at once
+        h = np.zeros((x.shape[0], units), dtype=np.float32)
+        outputs = np.empty((x.shape[0], x.shape[1], units), dtype=np.float32)
+        for t in range(x.shape[1]):
+            x_z, x_r, x_h = np.split(x_proj[:, t], 3, axis=-1)
+            h_proj = h @ recurrent_kernel + recurrent_bias
+            h_z, h_r, h_h = np.split(h_proj, 3, axis=-1)
+            z = _sigmoid(x_z + h_z)
+            r = _sigmoid(x_r + h_r)
+            candidate = np.tanh(x_h + r * h_h)
+            h = z * h + (1 - z) * candidate
+            outputs[:, t] = h
+        return outputs
+
+    def encode(self, items: np.ndarray, genres: np.ndarray) -> np.ndarray:
+        """Mirror of `GRU4REC.encode` in inference mode."""
+        w = self.weights
+        item_embedded = w["item_embedding"][items].astype(np.float32)
+        if self.precision.get("item_embedding") == "int8":
+            item_embedded *= w["item_embedding.scale"][items][..., None]
+        genre_embedded = w["genre_embedding"][genres].mean(axis=2)
+        combined = np.concatenate([item_embedded, genre_embedded], axis=-1)
+        # BatchNormalization with moving statistics; the mean over the singleton
+        # axis in the Keras graph is the identity
+        combined = (combined - w["batch_norm.moving_mean"]) / np.sqrt(
+            w["batch_norm.moving_variance"] + self.manifest["batch_norm_epsilon"]
+        ) * w["batch_norm.gamma"] + w["batch_norm.beta"]
+        combined = combined.astype(np.float32)
+
+        x = self._gru("gru0", combined)
+        for i in range(1, self.manifest["rnn_layers"]):
+            x = self._gru(f"gru{i}", np.concatenate([combined, x], axis=-1))
+        return x
+
+    def item_head(self, x: np.ndarray) -> np.ndarray:
+        w = self.weights
+        x = x @ w["ffn1.kernel"] + w["ffn1.bias"]
+        x = np.where(x > 0, x, x * self.manifest["negative_slope"])
+        kernel = w["item_output.kernel"]
+        precision = self.precision.get("item_output.kernel")
+        if precision is None:
+            return x @ kernel + w["item_output.bias"]
+
+        # `x @ kernel` would upcast the whole kernel to a float32 copy
+        logits = np.empty(x.shape[:-1] + kernel.shape[1:], dtype=np.float32)
+        for start in range(0, kernel.shape[1], ITEM_BLOCK):
+            block = slice(start, start + ITEM_BLOCK)
+            logits[..., block] = x @ kernel[:, block].astype(np.float32)
+            if precision == "int8":
+                logits[..., block] *= w["item_output.kernel.scale"][block]
+        return logits + w["item_output.bias"]
+
+    def serve(self, items: np.ndarray, genres: np.ndarray) -> np.ndarray:
+        """Same outputs as `ServingModel.serve` for the configured logits mode."""
+        hidden = self.encode(items, genres)
+        if self.logits_mode == "last":
+            logits = self.item_head(hidden[:, -1])
+            ranked = np.argsort(-logits, axis=-1, kind="stable")
+            return ranked[:, :MAX_RECOMMENDATIONS]
+        return self.item_head(hidden)
+
+
+def decode(output: np.ndarray, item_length: int, logits_mode: str) -> list[int]:
+    """Item indices from the `serve` output of one history."""
+    if logits_mode == "last":
+        return output[: min(item_length, MAX_RECOMMENDATIONS)].tolist()
+
+    # Same decoding as `remove_duplicates_with_logit_check`
+    predicted = []
+    for step in range(min(item_length, output.shape[0])):
+        for index in np.argsort(-output[step], kind="stable"):
+            if index not in predicted:
+                predicted.append(int(index))
+                break
+    return predicted
+
+
+def numpy_predict(serving: NumpyServing, item_sequence, genres_sequence, item_length):
+    """Same contract as `serving.serving_predict`, without TensorFlow."""
+    output = serving.serve(*pad_history(item_sequence, genres_sequence))
+    return decode(output[0], item_length, serving.logits_mode)
+
+
+def numpy_predict_batch(
+    serving: NumpyServing, histories, item_length
+) -> list[list[int]]:
+    """`numpy_predict` for many `(items, genres)` histories in one forward pass."""
+    padded = [pad_history(items, genres) for items, genres in histories]
+    output = serving.serve(
+        np.concatenate([items for items, _ in padded]),
+        np.concatenate([genres for _, genres in padded]),
+    )
+    return [decode(row, item_length, serving.logits_mode) for row in output]
+
+
+def export_weights(model, directory: str = WEIGHTS_DIR, precision: str = "float32"):
+    """
+    Write the weights of a loaded GRU4REC model as `.npy` files plus a
+    manifest, as a new version of `directory`.
+    """
+    for layer in model.rnn_layers:
+        cell = layer.cell
+        if (
+            not cell.reset_after
+            or cell.activation.__name__ != "tanh"
+            or cell.recurrent_activation.__name__ != "sigmoid"
+        ):
+            raise ValueError(
+                "Only GRUs with reset_after=True, tanh and sigmoid are supported"
+            )
+
+    weights = {
+        "item_embedding": model.embedding.embeddings,
+        "genre_embedding": model.genre_embedding.embeddings,
+        "batch_norm.gamma": model.batch_norm.gamma,
+        "batch_norm.beta": model.batch_norm.beta,
+        "batch_norm.moving_mean": model.batch_norm.moving_mean,
+        "batch_norm.moving_variance": model.batch_norm.moving_variance,
+        "ffn1.kernel": model.ffn1.kernel,
+        "ffn1.bias": model.ffn1.bias,
+        "item_output.kernel": model.item_output.kernel,
+        "item_output.bias": model.item_output.bias,
+    }
+    for i, layer in enumerate(model.rnn_layers):
+        weights[f"gru{i}.kernel"] = layer.cell.kernel
+        weights[f"gru{i}.recurrent_kernel"] = layer.cell.recurrent_kernel
+        weights[f"gru{i}.bias"] = layer.cell.bias
+
+    weights, quantized = quantize(
+        {
+            name: np.asarray(variable.numpy(), dtype=np.float32)
+            for name, variable in weights.items()
+        },
+        precision,
+    )
+    manifest = {
+        "weights": sorted(weights),
+        "precision": quantized,
+        "rnn_layers": len(model.rnn_layers),
+        "batch_norm_epsilon": float(model.batch_norm.epsilon),
+        "negative_slope": float(model.activation1.negative_slope),
+        "items_size": model.items_size,
+    }
+
+    def write(path: str):
+        for name, array in weights.items():
+            np.save(os.path.join(path, f"{name}.npy"), array)
+        with open(os.path.join(path, "manifest.json"), "w") as fd:
+            json.dump(manifest, fd, indent=2)
+
+    publish_directory(directory, write)
+
+
+def check_against_keras(model, directory: str = WEIGHTS_DIR, batch: int = 8):
+    """Largest absolute logit difference between NumPy and Keras on random input."""
+    rng = np.random.default_rng(0)
+    items = rng.integers(0, model.items_size, (batch, SEQUENCE_LENGTH))
+    genres = rng.integers(
+        0, model.genres_size, (batch, SEQUENCE_LENGTH, GENRES_PER_ITEM)
+    )
+    features = np.zeros((batch, 0), dtype=np.float32)
+    expected = np.asarray(
+        model((items.astype(np.int32), features, genres.astype(np.int32)))
+    )
+    actual = NumpyServing.load(directory).serve(items, genres)
+    return float(np.abs(expected - actual).max())
+
+
+def main():
+    from .models import load_model
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--model", default=os.path.join(EXPORTED_MODELS_DIR, "gru4rec_model.keras")
+    )
+    parser.add_argument("--output", default=WEIGHTS_DIR)
+    parser.add_argument("--precision", choices=PRECISIONS, default="float32")
+    args = parser.parse_args()
+
+    model = load_model(args.model)
+    export_weights(model, args.output, args.precision)
+    difference = check_against_keras(model, args.output)
+    print(f"Weights written to {args.output}, max |numpy - keras| = {difference:.2e}")
+    # Reduced precision changes the logits by design; rank quality is measured
+    # by `benchmarks.quantized_ranking` instead
+    if args.precision == "float32" and difference > 1e-3:
+        raise SystemExit("NumPy forward pass does not match the Keras model")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Compiled serving function for the GRU4REC model.
+
+Calling the Keras model eagerly re-dispatches every op on each request and
+converts the float64 NumPy inputs produced by `process_sequences`. The
+`ServingModel` wraps the forward pass in a `tf.function` with fixed int32
+input signatures, so it is traced once and reused for every request and
+batch size. The same function is exported as a SavedModel signature, and
+loading that artifact restores the traced graph without re-tracing and
+without the Python model classes.
+
+Two logits modes are supported, chosen when a model version is exported and
+recorded next to it in `serving_config.json`:
+
+- "positions": item logits for all 15 positions, decoded one position per
+  recommended song by `remove_duplicates_with_logit_check` (original behavior)
+- "last": item logits only for the final hidden state, returned as the
+  `MAX_RECOMMENDATIONS` best item indices (the whole catalog if it is smaller)
+
+Export the artifact with:
+    python -m app.ml.ml_models.serving [--model path.keras] [--output dir]
+        [--logits-mode positions|last]
+
+Check that both modes serve a model, without exporting anything:
+    python -m app.ml.ml_models.serving --check [--model path.keras]
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from ..utils.processor import remove_duplicates_with_logit_check
+from .preprocessing import process_sequences
+
+SEQUENCE_LENGTH = 15
+GENRES_PER_ITEM = 15
+MAX_RECOMMENDATIONS = 50
+
+LOGITS_MODES = ("positions", "last")
+
+INPUT_SIGNATURE = [
+    tf.TensorSpec((None, SEQUENCE_LENGTH), tf.int32, name="items"),
+    tf.TensorSpec((None, SEQUENCE_LENGTH, GENRES_PER_ITEM), tf.int32, name="genres"),
+]
+
+EXPORTED_MODELS_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "exported_models"
+)
+SAVED_MODEL_DIR = os.path.join(EXPORTED_MODELS_DIR, "gru4rec_serving")
+
+
+class ServingModel(tf.Module):
+    def __init__(self, model, logits_mode: str = "positions"):
+        super().__init__()
+        if logits_mode not in LOGITS_MODES:
+            raise ValueError(f"Unknown logits mode: {logits_mode}")
+        self.model = model
+        self.logits_mode = logits_mode
+        # top_k fails when k exceeds the number of items
+        self.top_k = min(MAX_RECOMMENDATIONS, model.items_size)
+
+    @tf.function(input_signature=INPUT_SIGNATURE)
+    def serve(self, items, genres):
+        # The model takes an (unused) float feature tensor between the two
+        features = tf.zeros((tf.shape(items)[0], 0), tf.float32)
+        inputs = (items, features, genres)
+        if self.logits_mode == "last":
+            logits = self.model.call_last_position(inputs)
+            return tf.math.top_k(logits, k=self.top_k).indices
+        return self.model(inputs, training=False)
+
+
+def prepare_inputs(item_sequence, genres_sequence) -> tuple[np.ndarray, np.ndarray]:
+    """Pad one history to the serving shapes, as int32 with a batch axis of 1."""
+    items, genres, _ = process_sequences(
+        item_sequence, genres_sequence, SEQUENCE_LENGTH, GENRES_PER_ITEM
+    )
+    return items.astype(np.int32), genres.astype(np.int32)
+
+
+def serving_predict(
+    serving, item_sequence, genres_sequence, item_length, logits_mode="positions"
+):
+    """Same contract as `models.predict`, through the compiled `serve` function."""
+    items, genres = prepare_inputs(item_sequence, genres_sequence)
+    output = serving.serve(items=tf.constant(items), genres=tf.constant(genres))
+    if logits_mode == "last":
+        # Already ranked and distinct
+        return output[0, : min(item_length, MAX_RECOMMENDATIONS)].numpy().tolist()
+    return remove_duplicates_with_logit_check(output, item_length)
+
+
+def serving_predict_batch(
+    serving, histories, item_length, logits_mode="positions"
+) -> list[list[int]]:
+    """`serving_predict` for many `(items, genres)` histories in one model call."""
+    inputs = [prepare_inputs(items, genres) for items, genres in histories]
+    output = serving.serve(
+        items=tf.constant(np.concatenate([items for items, _ in inputs])),
+        genres=tf.constant(np.concatenate([genres for _, genres in inputs])),
+    )
+    if logits_mode == "last":
+        return output[:, : min(item_length, MAX_RECOMMENDATIONS)].numpy().tolist()
+    return [
+        remove_duplicates_with_logit_check(output[i : i + 1], item_length)
+        for i in range(len(inputs))
+    ]
+
+
+def export_serving_model(
+    model, path: str = SAVED_MODEL_DIR, logits_mode: str = "positions"
+):
+    serving = ServingModel(model, logits_mode)
+    tf.saved_model.save(serving, path, signatures={"serving_default": serving.serve})
+    with open(os.path.join(path, "serving_config.json"), "w") as fd:
+        json.dump({"logits_mode": logits_mode}, fd)
+
+
+def read_serving_config(path: str) -> dict:
+    """Settings an exported model version was built with."""
+    config_path = os.path.join(path, "serving_config.json")
+    if not os.path.exists(config_path):
+        return {"logits_mode": "positions"}
+    with open(config_path) as fd:
+        return json.load(fd)
+
+
+def load_serving_model(path: str = SAVED_MODEL_DIR):
+    """The exported module; its `serve` is the restored graph, no tracing needed."""
+    return tf.saved_model.load(path)
+
+
+def check_serving(serving, items_size: int, logits_mode: str):
+    """
+    Serve one history and a batch through `serving`, asking for more items
+    than `MAX_RECOMMENDATIONS` and than the catalog holds.
+    """
+    count = max(MAX_RECOMMENDATIONS, items_size) + 1
+    expected = min(MAX_RECOMMENDATIONS, items_size)
+    history = ([1, 2, 3], [[1], [2, 3], [4]])
+    single = serving_predict(serving, *history, count, logits_mode)
+    batch = serving_predict_batch(serving, [history, history], count, logits_mode)
+    if logits_mode == "last" and len(single) != expected:
+        raise AssertionError(f"{len(single)} recommendations, expected {expected}")
+    if any(list(map(int, result)) != list(map(int, single)) for result in batch):
+        raise AssertionError("Batched and single predictions differ")
+
+
+def main():
+    from .models import load_model
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--model", default=os.path.join(EXPORTED_MODELS_DIR, "gru4rec_model.keras")
+    )
+    parser.add_argument("--output", default=SAVED_MODEL_DIR)
+    parser.add_argument("--logits-mode", choices=LOGITS_MODES, default="positions")
+    parser.add_argument("--check", action="store_true")
+    args = parser.parse_args()
+
+    model = load_model(args.model)
+    if args.check:
+        for logits_mode in LOGITS_MODES:
+            serving = ServingModel(model, logits_mode)
+            check_serving(serving, model.items_size, logits_mode)
+            print(f"{logits_mode}: ok")
+        return
+
+    export_serving_model(model, args.output, args.logits_mode)
+    # The restored graph, as the registry will load it
+    check_serving(load_serving_model(args.output), model.items_size, args.logits_mode)
+    print(f"Serving model ({args.logits_mode} logits) written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
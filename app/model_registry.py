@@ -0,0 +1,287 @@
+"""
+Lazy loading of the recommendation model.
+
+Importing TensorFlow and Keras and deserializing `gru4rec_model.keras` takes
+several seconds, so nothing ML-related happens at import time. The registry
+loads the encoders and the model in a background thread once the app has
+started, then runs one warm-up prediction so the first real request does not
+pay for graph tracing. Until that finishes, `get()` returns None and callers
+fall back to something cheaper.
+
+Inference runs on a small dedicated executor (`run()`), not on the event loop.
+TensorFlow's intra-op and inter-op pools are sized from `Config` before the
+first op, and the executor and loader threads can be pinned to
+`inference_cpu_affinity`. TensorFlow's own pool threads inherit that pinning,
+so several workers on one pod do not oversubscribe the same cores.
+
+With `recommender_backend="numpy"` the model is served from memory-mapped
+`.npy` weights without TensorFlow, and `preload()` can load it in a pre-fork
+master so every worker shares the same pages.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import logging
+import os
+import threading
+import time
+
+from .config import config, parse_cpu_list
+
+logger = logging.getLogger(__name__)
+
+EXPORTED_MODELS_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "ml", "exported_models"
+)
+
+
+def pin_current_thread():
+    """Restrict the calling thread to `inference_cpu_affinity`, where supported."""
+    if config.inference_cpu_affinity is None:
+        return
+    if not hasattr(os, "sched_setaffinity"):
+        logger.warning("CPU affinity is not supported on this platform")
+        return
+    # On Linux, pid 0 means the calling thread
+    os.sched_setaffinity(0, parse_cpu_list(config.inference_cpu_affinity))
+
+
+def configure_tensorflow_threads():
+    """Size TensorFlow's thread pools; must run before TensorFlow executes any op."""
+    import tensorflow as tf
+
+    if config.tf_intra_op_threads is not None:
+        tf.config.threading.set_intra_op_parallelism_threads(
+            config.tf_intra_op_threads
+        )
+    if config.tf_inter_op_threads is not None:
+        tf.config.threading.set_inter_op_parallelism_threads(
+            config.tf_inter_op_threads
+        )
+
+
+@dataclass
+class Recommender:
+    # Anything with the compiled `serve(items, genres)` function: a
+    # `ServingModel` or the SavedModel exported from one
+    serving: object
+    song_encoder: object
+    genre_encoder: object
+    logits_mode: str = "positions"
+    backend: str = "tensorflow"
+
+    def recommend(
+        self, song_ml_ids: list[str], genres: list[list[str]], count: int
+    ) -> list[str]:
+        """ml_ids of the next `count` songs for a listening history."""
+        encoded_songs = self.song_encoder.transform(song_ml_ids)
+        encoded_genres = [self.genre_encoder.transform(genre) for genre in genres]
+        if self.backend == "numpy":
+            from .ml.ml_models.numpy_serving import numpy_predict
+
+            predicted = numpy_predict(
+                self.serving, encoded_songs, encoded_genres, count
+            )
+        else:
+            from .ml.ml_models.serving import serving_predict
+
+            predicted = serving_predict(
+                self.serving, encoded_songs, encoded_genres, count, self.logits_mode
+            )
+        return list(self.song_encoder.inverse_transform(predicted))
+
+    def recommend_batch(
+        self, histories: list[tuple[list[str], list[list[str]]]], count: int
+    ) -> list[list[str] | None]:
+        """
+        `recommend` for many `(song_ml_ids, genres)` histories in one model call.
+
+        Histories with labels the encoders do not know get None.
+        """
+        encoded = []
+        for song_ml_ids, genres in histories:
+            try:
+                encoded.append(
+                    (
+                        self.song_encoder.transform(song_ml_ids),
+                        [self.genre_encoder.transform(genre) for genre in genres],
+                    )
+                )
+            except ValueError:
+                encoded.append(None)
+        valid = [history for history in encoded if history is not None]
+        if not valid:
+            return [None] * len(histories)
+
+        if self.backend == "numpy":
+            from .ml.ml_models.numpy_serving import numpy_predict_batch
+
+            predicted = numpy_predict_batch(self.serving, valid, count)
+        else:
+            from .ml.ml_models.serving import serving_predict_batch
+
+            predicted = serving_predict_batch(
+                self.serving, valid, count, self.logits_mode
+            )
+        predicted = iter(predicted)
+        return [
+            None
+            if history is None
+            else list(self.song_encoder.inverse_transform(next(predicted)))
+            for history in encoded
+        ]
+
+
+class ModelRegistry:
+    LOADING = "loading"
+    READY = "ready"
+    FAILED = "failed"
+
+    def __init__(self, model_dir: str | None = None):
+        # recommender_model_dir selects a model version other than the bundled one
+        self.model_dir = (
+            model_dir or config.recommender_model_dir or EXPORTED_MODELS_DIR
+        )
+        self.status = self.LOADING
+        self.error: str | None = None
+        self._recommender: Recommender | None = None
+        self._thread: threading.Thread | None = None
+        self._executor: ThreadPoolExecutor | None = None
+
+    def start(self):
+        """Start loading in the background; returns immediately."""
+        if self._thread is not None or self.status == self.READY:
+            return
+        self._thread = threading.Thread(
+            target=self._load, name="model-registry", daemon=True
+        )
+        self._thread.start()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.status == self.READY
+
+    def get(self) -> Recommender | None:
+        """The warmed-up recommender, or None while loading or after a failure."""
+        return self._recommender
+
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=config.inference_threads,
+                thread_name_prefix="inference",
+                initializer=pin_current_thread,
+            )
+        return self._executor
+
+    async def run(self, fn, *args):
+        """Run an inference call on the inference executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor(), fn, *args)
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def preload(self):
+        """
+        Load synchronously, before the server forks its workers.
+
+        Only the NumPy backend is preloaded: its weights are read-only mappings
+        that forked workers share copy-on-write. TensorFlow's runtime threads
+        do not survive a fork, so the TensorFlow backend keeps loading in each
+        worker after startup.
+
+        The calling thread is not pinned to `inference_cpu_affinity`. In a
+        pre-fork master it is the main thread, and every worker would inherit
+        the pinning for its event loop. Only the inference executor threads,
+        created in each worker after the fork, are pinned.
+        """
+        if config.recommender_backend != "numpy":
+            logger.warning(
+                "model_preload requires recommender_backend='numpy'; "
+                "loading in each worker instead"
+            )
+            return
+        self._load(pin=False)
+
+    def _load(self, pin: bool = True):
+        start = time.perf_counter()
+        try:
+            if pin:
+                # The dedicated loader thread, and TensorFlow's pools it creates
+                pin_current_thread()
+            if config.recommender_backend != "numpy":
+                configure_tensorflow_threads()
+            recommender = self.load()
+            self.warm_up(recommender)
+        except Exception as e:
+            logger.exception("Loading the recommendation model failed")
+            self.error = str(e)
+            self.status = self.FAILED
+            return
+        self._recommender = recommender
+        self.status = self.READY
+        logger.info("Recommendation model ready in %.1fs", time.perf_counter() - start)
+
+    def load_serving(self) -> tuple[object, str]:
+        """
+        The serving function and its logits mode.
+
+        An exported SavedModel carries its mode in `serving_config.json`; the
+        plain Keras model is wrapped with `recommender_logits_mode`, as are the
+        weights of the NumPy backend.
+        """
+        if config.recommender_backend == "numpy":
+            from .ml.ml_models.numpy_serving import NumpyServing
+
+            logits_mode = config.recommender_logits_mode
+            serving = NumpyServing.load(
+                os.path.join(self.model_dir, "gru4rec_weights"), logits_mode
+            )
+            return serving, logits_mode
+
+        from .ml.ml_models.serving import (
+            ServingModel,
+            load_serving_model,
+            read_serving_config,
+        )
+
+        saved_model = os.path.join(self.model_dir, "gru4rec_serving")
+        if os.path.isdir(saved_model):
+            logits_mode = read_serving_config(saved_model)["logits_mode"]
+            return load_serving_model(saved_model), logits_mode
+
+        from .ml.ml_models.models import load_model
+
+        model = load_model(os.path.join(self.model_dir, "gru4rec_model.keras"))
+        logits_mode = config.recommender_logits_mode
+        return ServingModel(model, logits_mode), logits_mode
+
+    def load(self) -> Recommender:
+        # joblib directly rather than `models.load_encoder`, which would import
+        # Keras and TensorFlow on the NumPy backend
+        import joblib
+
+        serving, logits_mode = self.load_serving()
+        return Recommender(
+            serving=serving,
+            logits_mode=logits_mode,
+            backend=config.recommender_backend,
+            song_encoder=joblib.load(os.path.join(self.model_dir, "song_encoder.pkl")),
+            genre_encoder=joblib.load(
+                os.path.join(self.model_dir, "genre_encoder.pkl")
+            ),
+        )
+
+    def warm_up(self, recommender: Recommender):
+        """One prediction with known classes, to trace the model before traffic."""
+        song = recommender.song_encoder.classes_[0]
+        genre = recommender.genre_encoder.classes_[0]
+        recommender.recommend([song], [[genre]], 1)
+
+
+model_registry = ModelRegistry()
@@ -1,12 +1,12 @@
 from sqlmodel import SQLModel, Field, Relationship
 from datetime import datetime, timezone
 from pydantic import EmailStr
-from sqlalchemy import event
+from sqlalchemy import DateTime, Index, event, inspect, insert
+from sqlalchemy.dialects import mysql
 
-from .dependencies.cloud_storage import get_bucket
-from .bucket_functions import delete_file
-
-bucket = get_bucket()
+# `updated_at` feeds HTTP validators; MySQL DATETIME defaults to whole seconds,
+# which would give two edits in the same second the same ETag
+PreciseDateTime = DateTime().with_variant(mysql.DATETIME(fsp=6), "mysql")
 
 
 class Users(SQLModel, table=True):
@@ -15,7 +15,10 @@ class Users(SQLModel, table=True):
         default_factory=lambda: datetime.now(timezone.utc), nullable=False
     )
     updated_at: datetime = Field(
-        default_factory=lambda: datetime.now(timezone.utc), nullable=False
+        default_factory=lambda: datetime.now(timezone.utc),
+        nullable=False,
+        sa_type=PreciseDateTime,
+        sa_column_kwargs={"onupdate": lambda: datetime.now(timezone.utc)},
     )
     fullname: str
     username: str
@@ -61,13 +64,50 @@ class Blacklist_Tokens(SQLModel, table=True):
     expires_at: datetime
 
 
+class Blob_Deletions(SQLModel, table=True):
+    id: int = Field(default=None, primary_key=True, index=True, nullable=False)
+    created_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc), nullable=False
+    )
+    blob_name: str
+    attempts: int = Field(default=0)
+    next_attempt_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc), index=True, nullable=False
+    )
+    last_error: str | None = Field(default=None)
+
+
+def enqueue_blob_deletions(connection, target, *blob_names: str):
+    """
+    Record blobs to delete in the outbox as part of the current flush.
+
+    The rows commit or roll back together with the delete that produced them;
+    the blob deletion worker removes the files once the transaction commits.
+    """
+    now = datetime.now(timezone.utc)
+    rows = [
+        {"blob_name": name, "created_at": now, "next_attempt_at": now}
+        for name in blob_names
+        if name
+    ]
+    if not rows:
+        return
+    connection.execute(insert(Blob_Deletions), rows)
+    session = inspect(target).session
+    if session is not None:
+        session.info["pending_blob_deletions"] = True
+
+
 class Albums(SQLModel, table=True):
     id: int = Field(default=None, primary_key=True, index=True, nullable=False)
     created_at: datetime = Field(
         default_factory=lambda: datetime.now(timezone.utc), nullable=False
     )
     updated_at: datetime = Field(
-        default_factory=lambda: datetime.now(timezone.utc), nullable=False
+        default_factory=lambda: datetime.now(timezone.utc),
+        nullable=False,
+        sa_type=PreciseDateTime,
+        sa_column_kwargs={"onupdate": lambda: datetime.now(timezone.utc)},
     )
     name: str
     singer_id: int = Field(foreign_key="users.id")
@@ -81,7 +121,9 @@ class Albums(SQLModel, table=True):
 event.listen(
     Albums,
     "after_delete",
-    lambda mapper, connection, target: delete_file(bucket, target.cover),
+    lambda mapper, connection, target: enqueue_blob_deletions(
+        connection, target, target.cover
+    ),
 )
 
 
@@ -91,7 +133,10 @@ class Songs(SQLModel, table=True):
         default_factory=lambda: datetime.now(timezone.utc), nullable=False
     )
     updated_at: datetime = Field(
-        default_factory=lambda: datetime.now(timezone.utc), nullable=False
+        default_factory=lambda: datetime.now(timezone.utc),
+        nullable=False,
+        sa_type=PreciseDateTime,
+        sa_column_kwargs={"onupdate": lambda: datetime.now(timezone.utc)},
     )
     name: str
     singer_id: int = Field(foreign_key="users.id")
@@ -101,6 +146,10 @@ class Songs(SQLModel, table=True):
     popularity: float
     genre: str
     duration: int
+    bitrate: int | None = None
+    sample_rate: int | None = None
+    channels: int | None = None
+    content_hash: str | None = Field(default=None, index=True)
     cover: str
     cover_url: str
     song: str
@@ -120,9 +169,8 @@ class Songs(SQLModel, table=True):
 event.listen(
     Songs,
     "after_delete",
-    lambda mapper, connection, target: (
-        delete_file(bucket, target.cover),
-        delete_file(bucket, target.song),
+    lambda mapper, connection, target: enqueue_blob_deletions(
+        connection, target, target.cover, target.song
     ),
 )
 
@@ -144,7 +192,10 @@ class Playlists(SQLModel, table=True):
         default_factory=lambda: datetime.now(timezone.utc), nullable=False
     )
     updated_at: datetime = Field(
-        default_factory=lambda: datetime.now(timezone.utc), nullable=False
+        default_factory=lambda: datetime.now(timezone.utc),
+        nullable=False,
+        sa_type=PreciseDateTime,
+        sa_column_kwargs={"onupdate": lambda: datetime.now(timezone.utc)},
     )
     name: str
     user_id: int = Field(foreign_key="users.id")
@@ -156,22 +207,35 @@ class Playlists(SQLModel, table=True):
 
 
 class Playlist_Songs(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_playlist_songs_playlist_id_position", "playlist_id", "position"),
+    )
+
     playlist_id: int = Field(
         foreign_key="playlists.id", primary_key=True, nullable=False
     )
     song_id: int = Field(foreign_key="songs.id", primary_key=True, nullable=False)
+    # Sparse sort key: tracks are spaced POSITION_GAP apart so a move only
+    # rewrites the moved row until a gap is used up
+    position: int = Field(default=0, nullable=False)
 
     playlist: Playlists = Relationship(back_populates="songs")
     song: Songs = Relationship(back_populates="playlists")
 
 
 class Posts(SQLModel, table=True):
+    # Newest posts of one author, for profiles and the pulled part of the feed
+    __table_args__ = (Index("ix_posts_user_id_created_at", "user_id", "created_at"),)
+
     id: int = Field(default=None, primary_key=True, index=True, nullable=False)
     created_at: datetime = Field(
         default_factory=lambda: datetime.now(timezone.utc), nullable=False
     )
     updated_at: datetime = Field(
-        default_factory=lambda: datetime.now(timezone.utc), nullable=False
+        default_factory=lambda: datetime.now(timezone.utc),
+        nullable=False,
+        sa_type=PreciseDateTime,
+        sa_column_kwargs={"onupdate": lambda: datetime.now(timezone.utc)},
     )
     user_id: int = Field(foreign_key="users.id")
     title: str
@@ -199,7 +263,10 @@ class Comments(SQLModel, table=True):
         default_factory=lambda: datetime.now(timezone.utc), nullable=False
     )
     updated_at: datetime = Field(
-        default_factory=lambda: datetime.now(timezone.utc), nullable=False
+        default_factory=lambda: datetime.now(timezone.utc),
+        nullable=False,
+        sa_type=PreciseDateTime,
+        sa_column_kwargs={"onupdate": lambda: datetime.now(timezone.utc)},
     )
     post_id: int = Field(foreign_key="posts.id")
     user_id: int = Field(foreign_key="users.id")
@@ -226,7 +293,25 @@ class Follows(SQLModel, table=True):
     )
 
 
+class Feed_Entries(SQLModel, table=True):
+    """A followed user's post materialized in a follower's home timeline."""
+
+    __table_args__ = (
+        Index("ix_feed_entries_user_id_created_at", "user_id", "created_at"),
+    )
+
+    user_id: int = Field(foreign_key="users.id", primary_key=True, nullable=False)
+    post_id: int = Field(foreign_key="posts.id", primary_key=True, nullable=False)
+    author_id: int = Field(foreign_key="users.id", index=True, nullable=False)
+    # Copied from the post so timelines are ordered without joining posts
+    created_at: datetime = Field(nullable=False)
+
+
 class Histories(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_histories_user_id_created_at", "user_id", "created_at"),
+    )
+
     id: int = Field(default=None, primary_key=True, index=True, nullable=False)
     created_at: datetime = Field(
         default_factory=lambda: datetime.now(timezone.utc), nullable=False
@@ -236,3 +321,17 @@ class Histories(SQLModel, table=True):
 
     user: Users = Relationship(back_populates="histories")
     song: Songs = Relationship(back_populates="histories")
+
+
+class User_Recommendations(SQLModel, table=True):
+    """Top songs for a user, written by `jobs.precompute_recommendations`."""
+
+    user_id: int = Field(
+        foreign_key="users.id", primary_key=True, nullable=False, ondelete="CASCADE"
+    )
+    position: int = Field(primary_key=True, nullable=False)
+    song_id: int = Field(
+        foreign_key="songs.id", index=True, nullable=False, ondelete="CASCADE"
+    )
+    # Start of the job run that produced the row
+    generated_at: datetime = Field(nullable=False)
@@ -46,6 +46,25 @@ class SongPublic(SQLModel):
     cover_url: str
 
 
+class SongRefPublic(SQLModel):
+    id: int
+    created_at: datetime
+    updated_at: datetime
+    name: str
+    like_count: int
+    duration: int
+    singer_id: int
+    album_id: int | None = None
+    song_url: str
+    cover_url: str
+
+
+class NormalizedSongsPublic(SQLModel):
+    songs: list[SongRefPublic]
+    users: dict[int, UserPublic] = {}
+    albums: dict[int, AlbumPublic] = {}
+
+
 class DetailedAlbumPublic(SQLModel):
     id: int
     created_at: datetime
@@ -53,6 +72,7 @@ class DetailedAlbumPublic(SQLModel):
     name: str
     singer: UserPublic
     cover_url: str
+    song_count: int
     songs: list[SongPublic]
 
 
@@ -91,4 +111,42 @@ class DetailedPlaylistPublic(SQLModel):
     created_at: datetime
     updated_at: datetime
     name: str
+    song_count: int
     songs: list[SongPublic]
+
+
+class PlaylistTrackPublic(SQLModel):
+    song_id: int
+    position: int
+
+
+class PlaylistTracksChange(SQLModel):
+    playlist_id: int
+    added: list[PlaylistTrackPublic] = []
+    moved: list[PlaylistTrackPublic] = []
+    removed: list[int] = []
+    skipped: list[int] = []
+
+
+class AlbumSummaryPublic(SQLModel):
+    id: int
+    created_at: datetime
+    updated_at: datetime
+    name: str
+    singer: UserPublic
+    cover_url: str
+
+
+class SongBatchPublic(SQLModel):
+    items: list[SongPublic]
+    missing: list[int] = []
+
+
+class UserBatchPublic(SQLModel):
+    items: list[UserPublic]
+    missing: list[int] = []
+
+
+class AlbumBatchPublic(SQLModel):
+    items: list[AlbumSummaryPublic]
+    missing: list[int] = []
@@ -1,17 +1,42 @@
-from fastapi import APIRouter, Form, UploadFile, File, HTTPException, Query
+from fastapi import APIRouter, Form, UploadFile, File, HTTPException, Query, Request
 from typing import Annotated
-from sqlmodel import SQLModel, select
+from sqlmodel import SQLModel, Session, select, func, col
+from sqlalchemy.orm import joinedload
 from datetime import datetime
 
-from ..models import Albums, Songs
+from ..models import Albums, Songs, Users
 from ..dependencies.auth import CurrentUser
 from ..dependencies.db import SessionDep
 from ..dependencies.cloud_storage import BucketDep
-from ..bucket_functions import upload_file, delete_file
-from ..response_models import DetailedAlbumPublic, UserPublic, AlbumPublic
+from ..bucket_functions import upload_files, delete_file
+from ..blob_deletion import queue_blob_deletion
+from ..delete_functions import delete_album_cascade
+from ..cache import entity_cache
+from ..serialization import batch_response, list_response, song_list_response
+from ..dependencies.batch_ids import BatchIdsDep
+from ..dependencies.sparse_fields import SongListOptionsDep
+from ..http_caching import (
+    as_utc,
+    entity_response,
+    has_validators,
+    is_not_modified,
+    make_etag,
+    not_modified_response,
+)
+from ..response_models import (
+    DetailedAlbumPublic,
+    UserPublic,
+    AlbumPublic,
+    AlbumBatchPublic,
+    AlbumSummaryPublic,
+    NormalizedSongsPublic,
+    SongPublic,
+)
 
 router = APIRouter(prefix="/albums", tags=["albums"])
 
+FIRST_PAGE_SIZE = 30
+
 
 class AlbumCreate(SQLModel):
     name: str
@@ -34,6 +59,76 @@ class AlbumDelete(SQLModel):
     singer: UserPublic
 
 
+def album_validators(
+    album_id: int, updated_at, singer_updated_at, songs_updated_at, song_count: int
+):
+    """
+    ETag and Last-Modified of an album page, which embeds its singer and lists
+    its songs.
+
+    `songs_updated_at` is the newest change among all the album's songs, a
+    superset of the first page, so it comes from one aggregate query.
+    """
+    versions = (updated_at, singer_updated_at, songs_updated_at)
+    last_modified = max(as_utc(value) for value in versions if value is not None)
+    etag = make_etag("album", album_id, *versions, song_count)
+    return etag, last_modified
+
+
+def album_song_count(session: Session, album_id: int) -> int:
+    """Number of songs in the album, cached until a song joins or leaves it."""
+    count = entity_cache.get_count("album_song_count", album_id)
+    if count is None:
+        count = session.exec(
+            select(func.count(Songs.id)).where(Songs.album_id == album_id)
+        ).one()
+        entity_cache.set_count("album_song_count", album_id, count)
+    return count
+
+
+def album_tracks_query(album_id: int):
+    return (
+        select(Songs)
+        .where(Songs.album_id == album_id)
+        .order_by(Songs.created_at, Songs.id)
+        .options(joinedload(Songs.singer), joinedload(Songs.album))
+    )
+
+
+def album_validator_row(session: Session, album_id: int):
+    """`album_validators` arguments in one indexed query, None if there is no album."""
+    return session.exec(
+        select(
+            Albums.updated_at,
+            Users.updated_at,
+            func.max(Songs.updated_at),
+            func.count(Songs.id),
+        )
+        .join(Users, Albums.singer_id == Users.id)
+        .join(Songs, Songs.album_id == Albums.id, isouter=True)
+        .where(Albums.id == album_id)
+        .group_by(Albums.id, Users.id)
+    ).one_or_none()
+
+
+def album_detail(
+    session: Session, album: Albums, song_count: int | None = None
+) -> DetailedAlbumPublic:
+    songs = session.exec(album_tracks_query(album.id).limit(FIRST_PAGE_SIZE)).all()
+    if song_count is None:
+        song_count = album_song_count(session, album.id)
+    return DetailedAlbumPublic(
+        id=album.id,
+        created_at=album.created_at,
+        updated_at=album.updated_at,
+        name=album.name,
+        singer=album.singer,
+        cover_url=album.cover_url,
+        song_count=song_count,
+        songs=songs,
+    )
+
+
 @router.get("/", response_model=list[AlbumPublic])
 async def get_all_albums(
     session: SessionDep,
@@ -49,15 +144,63 @@ async def get_all_albums(
         .offset(offset)
         .limit(itemPerPage)
     ).all()
-    return albums
+    return list_response(AlbumPublic, albums)
+
+
+@router.get("/batch", response_model=AlbumBatchPublic)
+async def get_albums_batch(ids: BatchIdsDep, session: SessionDep):
+    """Albums for up to `batch_max_ids` ids in request order, plus the ids not found."""
+    albums = session.exec(
+        select(Albums)
+        .where(col(Albums.id).in_(ids))
+        .options(joinedload(Albums.singer))
+    ).all()
+    return batch_response(AlbumSummaryPublic, ids, albums)
 
 
 @router.get("/{album_id}", response_model=DetailedAlbumPublic)
-async def get_album(album_id: int, session: SessionDep):
+async def get_album(album_id: int, request: Request, session: SessionDep):
+    """Album header with its track count and the first page of tracks."""
+    cached = entity_cache.get("album", album_id)
+    if cached is not None:
+        return entity_response(request, cached)
+
+    # Validators first: a revalidation is answered without loading any song
+    validators = album_validator_row(session, album_id)
+    if validators is None:
+        raise HTTPException(status_code=404, detail="Album not found")
+    etag, last_modified = album_validators(album_id, *validators)
+    if has_validators(request) and is_not_modified(request, etag, last_modified):
+        return not_modified_response(etag, last_modified)
+
     album = session.get(Albums, album_id)
     if not album:
         raise HTTPException(status_code=404, detail="Album not found")
-    return album
+    detail = album_detail(session, album, song_count=validators[-1])
+    cached = entity_cache.set(
+        "album", album_id, detail, etag=etag, last_modified=last_modified
+    )
+    return entity_response(request, cached)
+
+
+@router.get(
+    "/{album_id}/songs", response_model=list[SongPublic] | NormalizedSongsPublic
+)
+async def get_album_songs(
+    album_id: int,
+    session: SessionDep,
+    options: SongListOptionsDep,
+    page: Annotated[int, Query(ge=1)] = 1,
+    itemPerPage: Annotated[int, Query(ge=10, le=100)] = 30,
+):
+    album = session.get(Albums, album_id)
+    if not album:
+        raise HTTPException(status_code=404, detail="Album not found")
+    offset = (page - 1) * itemPerPage
+    songs = session.exec(
+        album_tracks_query(album_id).offset(offset).limit(itemPerPage)
+    ).all()
+    return song_list_response(songs, options)
 
 
 @router.post("/", response_model=DetailedAlbumPublic)
@@ -93,7 +236,9 @@ async def create_album(
 
     try:
         folder_name = "album_cover"
-        blob_name, public_url = upload_file(bucket, current_user.id, cover, folder_name)
+        [(blob_name, public_url)] = await upload_files(
+            bucket, current_user.id, [(cover, folder_name)]
+        )
 
         album = AlbumCreate(
             name=name, singer_id=current_user.id, cover=blob_name, cover_url=public_url
@@ -103,7 +248,7 @@ async def create_album(
         session.commit()
         session.refresh(db_album)
 
-        return db_album
+        return album_detail(session, db_album)
     except Exception as e:
         session.rollback()
         if blob_name:
@@ -154,11 +299,11 @@ async def update_album(
         folder_name = "album_cover"
         album = AlbumUpdate()
         if cover is not None:
-            blob_name, public_url = upload_file(
-                bucket, current_user.id, cover, folder_name
+            [(blob_name, public_url)] = await upload_files(
+                bucket, current_user.id, [(cover, folder_name)]
             )
 
-            delete_file(bucket, album_db.cover)
+            queue_blob_deletion(session, album_db.cover)
 
             album.cover = blob_name
             album.cover_url = public_url
@@ -170,7 +315,13 @@ async def update_album(
         session.add(album_db)
         session.commit()
         session.refresh(album_db)
-        return album_db
+        entity_cache.invalidate("album", album_id)
+        # Songs embed the album
+        entity_cache.invalidate(
+            "song",
+            *session.exec(select(Songs.id).where(Songs.album_id == album_id)).all(),
+        )
+        return album_detail(session, album_db)
     except Exception as e:
         session.rollback()
         if blob_name:
@@ -191,9 +342,10 @@ async def delete_album(album_id: int, session: SessionDep, current_user: Current
         raise HTTPException(status_code=403, detail="Can not delete other user's album")
 
     try:
-        session.delete(album)
-        session.commit()
-        return album
+        deleted_album = AlbumDelete.model_validate(album)
+        # The cascade invalidates the cached album and songs
+        delete_album_cascade(session, album_id)
+        return deleted_album
     except Exception as e:
         session.rollback()
         raise HTTPException(
@@ -231,7 +383,10 @@ async def add_song_to_album(
     session.add(song)
     session.commit()
     session.refresh(album)
-    return album
+    entity_cache.invalidate("album", album_id)
+    entity_cache.invalidate("album_song_count", album_id)
+    entity_cache.invalidate("song", song_id)
+    return album_detail(session, album)
 
 
 @router.delete("/{album_id}/songs/{song_id}", response_model=DetailedAlbumPublic)
@@ -255,4 +410,7 @@ async def remove_song_from_album(
     session.add(song)
     session.commit()
     session.refresh(album)
-    return album
+    entity_cache.invalidate("album", album_id)
+    entity_cache.invalidate("album_song_count", album_id)
+    entity_cache.invalidate("song", song_id)
+    return album_detail(session, album)
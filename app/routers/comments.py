@@ -1,11 +1,13 @@
 from fastapi import APIRouter, Body, Query, HTTPException
 from typing import Annotated
 from sqlmodel import SQLModel, select
+from sqlalchemy.orm import selectinload
 
 from ..models import Comments, Posts
 from ..dependencies.db import SessionDep
 from ..dependencies.auth import CurrentUser
 from ..response_models import CommentPublic
+from ..serialization import list_response
 
 router = APIRouter(prefix="/posts/{post_id}/comments", tags=["posts"])
 
@@ -33,8 +35,9 @@ async def get_all_comments(
         .order_by(Comments.created_at.desc())
         .offset(offset)
         .limit(itemPerPage)
+        .options(selectinload(Comments.user))
     ).all()
-    return comments
+    return list_response(CommentPublic, comments)
 
 
 @router.post("/", response_model=CommentPublic)
@@ -0,0 +1,26 @@
+from fastapi import APIRouter, Query
+from typing import Annotated
+
+from ..dependencies.auth import CurrentUser
+from ..dependencies.db import SessionDep
+from ..response_models import PostPublic
+from ..serialization import list_response
+from ..feed import read_feed, trim_timeline
+
+router = APIRouter(prefix="/feed", tags=["feed"])
+
+
+@router.get("/", response_model=list[PostPublic])
+async def get_feed(
+    session: SessionDep,
+    current_user: CurrentUser,
+    page: Annotated[int, Query(ge=1)] = 1,
+    itemPerPage: Annotated[int, Query(ge=10, le=30)] = 10,
+):
+    """Posts of the accounts the current user follows, newest first."""
+    offset = (page - 1) * itemPerPage
+    # Timelines are trimmed lazily, when their owner opens the feed
+    if page == 1 and trim_timeline(session, current_user.id):
+        session.commit()
+    posts = read_feed(session, current_user.id, offset, itemPerPage)
+    return list_response(PostPublic, posts)
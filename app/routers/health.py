@@ -0,0 +1,22 @@
+from fastapi import APIRouter
+from fastapi.responses import ORJSONResponse
+
+from ..model_registry import model_registry
+
+router = APIRouter(tags=["health"])
+
+
+@router.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok"}
+
+
+@router.get("/readyz")
+async def readyz():
+    """Readiness: the recommendation model is loaded and warmed up."""
+    body = {"status": model_registry.status}
+    if model_registry.error is not None:
+        body["error"] = model_registry.error
+    status_code = 200 if model_registry.status == model_registry.READY else 503
+    return ORJSONResponse(body, status_code=status_code)
@@ -1,20 +1,203 @@
-from fastapi import APIRouter, Body, HTTPException, Query
+from fastapi import APIRouter, Body, HTTPException, Query, Request
 from typing import Annotated
-from sqlmodel import SQLModel, select
+from datetime import datetime, timezone
+from sqlmodel import SQLModel, Field, Session, select, func, col
+from sqlalchemy import delete, update
+from sqlalchemy.orm import selectinload
 
-from ..models import Playlists, Playlist_Songs, Songs
+from ..models import Albums, Playlists, Playlist_Songs, Songs, Users
 from ..dependencies.db import SessionDep
 from ..dependencies.auth import CurrentUser
-from ..response_models import PlaylistPublic, DetailedPlaylistPublic
+from ..response_models import (
+    PlaylistPublic,
+    DetailedPlaylistPublic,
+    NormalizedSongsPublic,
+    PlaylistTrackPublic,
+    PlaylistTracksChange,
+    SongPublic,
+)
+from ..dependencies.sparse_fields import SongListOptionsDep
+from ..delete_functions import delete_playlist_cascade
+from ..cache import entity_cache
+from ..serialization import list_response, song_list_response
+from ..http_caching import (
+    as_utc,
+    entity_response,
+    is_not_modified,
+    make_etag,
+    not_modified_response,
+)
 
 router = APIRouter(prefix="/playlists", tags=["playlists"])
 
+POSITION_GAP = 1024
+FIRST_PAGE_SIZE = 30
+
 
 class PlaylistCreate(SQLModel):
     name: str
     user_id: int
 
 
+class PlaylistSongsUpdate(SQLModel):
+    song_ids: Annotated[list[int], Field(min_length=1, max_length=500)]
+
+
+class PlaylistSongMove(SQLModel):
+    index: Annotated[int, Field(ge=0)]
+
+
+def get_own_playlist(
+    session: Session, playlist_id: int, current_user: Users, detail: str
+) -> Playlists:
+    playlist = session.get(Playlists, playlist_id)
+    if not playlist:
+        raise HTTPException(status_code=404, detail="Playlist not found")
+    if playlist.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail=detail)
+    return playlist
+
+
+def touch_playlist(session: Session, playlist: Playlists):
+    playlist.updated_at = datetime.now(timezone.utc)
+    session.add(playlist)
+
+
+def playlist_tracks_query(playlist_id: int):
+    return (
+        select(Songs)
+        .join(Playlist_Songs, Playlist_Songs.song_id == Songs.id)
+        .where(Playlist_Songs.playlist_id == playlist_id)
+        .order_by(Playlist_Songs.position, Playlist_Songs.song_id)
+        .options(selectinload(Songs.singer), selectinload(Songs.album))
+    )
+
+
+def append_tracks(
+    session: Session, playlist_id: int, song_ids: list[int]
+) -> list[PlaylistTrackPublic]:
+    last_position = session.exec(
+        select(func.max(Playlist_Songs.position)).where(
+            Playlist_Songs.playlist_id == playlist_id
+        )
+    ).one()
+    start = POSITION_GAP if last_position is None else last_position + POSITION_GAP
+    tracks = [
+        PlaylistTrackPublic(song_id=song_id, position=start + i * POSITION_GAP)
+        for i, song_id in enumerate(song_ids)
+    ]
+    session.add_all(
+        Playlist_Songs(playlist_id=playlist_id, **track.model_dump())
+        for track in tracks
+    )
+    return tracks
+
+
+def renumber_tracks(session: Session, playlist_id: int):
+    """Respace every track POSITION_GAP apart, keeping the current order."""
+    song_ids = session.exec(
+        select(Playlist_Songs.song_id)
+        .where(Playlist_Songs.playlist_id == playlist_id)
+        .order_by(Playlist_Songs.position, Playlist_Songs.song_id)
+    ).all()
+    session.execute(
+        update(Playlist_Songs),
+        [
+            {
+                "playlist_id": playlist_id,
+                "song_id": song_id,
+                "position": (i + 1) * POSITION_GAP,
+            }
+            for i, song_id in enumerate(song_ids)
+        ],
+    )
+
+
+def position_at(session: Session, playlist_id: int, song_id: int, index: int):
+    """
+    Sort key that places `song_id` at `index` among the other tracks.
+
+    Returns None when the neighbouring positions are adjacent and the
+    playlist has to be renumbered first.
+    """
+    others = (
+        select(Playlist_Songs.position)
+        .where(
+            Playlist_Songs.playlist_id == playlist_id,
+            Playlist_Songs.song_id != song_id,
+        )
+        .order_by(Playlist_Songs.position, Playlist_Songs.song_id)
+    )
+    if index == 0:
+        before = None
+        after = session.exec(others.limit(1)).first()
+    else:
+        neighbours = session.exec(others.offset(index - 1).limit(2)).all()
+        if not neighbours:
+            # Past the end, move to the last place
+            before = session.exec(
+                select(func.max(Playlist_Songs.position)).where(
+                    Playlist_Songs.playlist_id == playlist_id,
+                    Playlist_Songs.song_id != song_id,
+                )
+            ).one()
+            after = None
+        else:
+            before = neighbours[0]
+            after = neighbours[1] if len(neighbours) > 1 else None
+
+    if before is None and after is None:
+        return POSITION_GAP
+    if before is None:
+        return after - POSITION_GAP
+    if after is None:
+        return before + POSITION_GAP
+    if after - before > 1:
+        return (before + after) // 2
+    return None
+
+
+def playlist_validators(
+    playlist_id: int,
+    updated_at,
+    songs_updated_at,
+    singers_updated_at,
+    albums_updated_at,
+    song_count: int,
+):
+    """
+    ETag and Last-Modified of a playlist page, which lists its songs with their
+    singer and album embedded.
+    """
+    versions = (updated_at, songs_updated_at, singers_updated_at, albums_updated_at)
+    last_modified = max(as_utc(value) for value in versions if value is not None)
+    etag = make_etag("playlist", playlist_id, *versions, song_count)
+    return etag, last_modified
+
+
+def playlist_validator_row(session: Session, playlist_id: int):
+    """`playlist_validators` arguments in one query, None if there is no playlist."""
+    return session.exec(
+        select(
+            Playlists.updated_at,
+            func.max(Songs.updated_at),
+            func.max(Users.updated_at),
+            func.max(Albums.updated_at),
+            func.count(Playlist_Songs.song_id),
+        )
+        .join(
+            Playlist_Songs,
+            Playlist_Songs.playlist_id == Playlists.id,
+            isouter=True,
+        )
+        .join(Songs, Songs.id == Playlist_Songs.song_id, isouter=True)
+        .join(Users, Songs.singer_id == Users.id, isouter=True)
+        .join(Albums, Songs.album_id == Albums.id, isouter=True)
+        .where(Playlists.id == playlist_id)
+        .group_by(Playlists.id)
+    ).one_or_none()
+
+
 @router.get("/", response_model=list[PlaylistPublic])
 async def get_all_playlists(
     session: SessionDep,
@@ -30,22 +213,64 @@ async def get_all_playlists(
         .offset(offset)
         .limit(itemPerPage)
     ).all()
-    return playlists
+    return list_response(PlaylistPublic, playlists)
 
 
 @router.get("/{playlist_id}", response_model=DetailedPlaylistPublic)
-async def get_playlist(playlist_id: int, session: SessionDep):
+async def get_playlist(playlist_id: int, request: Request, session: SessionDep):
+    """Playlist header with its track count and the first page of tracks."""
+    cached = entity_cache.get("playlist", playlist_id)
+    if cached is not None:
+        return entity_response(request, cached)
+
+    validators = playlist_validator_row(session, playlist_id)
+    if validators is None:
+        raise HTTPException(status_code=404, detail="Playlist not found")
+    etag, last_modified = playlist_validators(playlist_id, *validators)
+    if is_not_modified(request, etag, last_modified):
+        return not_modified_response(etag, last_modified)
+
     playlist = session.get(Playlists, playlist_id)
     if not playlist:
         raise HTTPException(status_code=404, detail="Playlist not found")
-    playlist_songs = [song.song for song in playlist.songs]
-    return DetailedPlaylistPublic(
-        id=playlist.id,
-        created_at=playlist.created_at,
-        updated_at=playlist.updated_at,
-        name=playlist.name,
-        songs=playlist_songs,
+    playlist_songs = session.exec(
+        playlist_tracks_query(playlist_id).limit(FIRST_PAGE_SIZE)
+    ).all()
+    cached = entity_cache.set(
+        "playlist",
+        playlist_id,
+        DetailedPlaylistPublic(
+            id=playlist.id,
+            created_at=playlist.created_at,
+            updated_at=playlist.updated_at,
+            name=playlist.name,
+            song_count=validators[-1],
+            songs=playlist_songs,
+        ),
+        etag=etag,
+        last_modified=last_modified,
     )
+    return entity_response(request, cached)
+
+
+@router.get(
+    "/{playlist_id}/songs", response_model=list[SongPublic] | NormalizedSongsPublic
+)
+async def get_playlist_songs(
+    playlist_id: int,
+    session: SessionDep,
+    options: SongListOptionsDep,
+    page: Annotated[int, Query(ge=1)] = 1,
+    itemPerPage: Annotated[int, Query(ge=10, le=100)] = 30,
+):
+    playlist = session.get(Playlists, playlist_id)
+    if not playlist:
+        raise HTTPException(status_code=404, detail="Playlist not found")
+    offset = (page - 1) * itemPerPage
+    songs = session.exec(
+        playlist_tracks_query(playlist_id).offset(offset).limit(itemPerPage)
+    ).all()
+    return song_list_response(songs, options)
 
 
 @router.post("/", response_model=PlaylistPublic)
@@ -80,6 +305,7 @@ async def update_playlist(
     session.add(playlist)
     session.commit()
     session.refresh(playlist)
+    entity_cache.invalidate("playlist", playlist_id)
     return playlist
 
 
@@ -94,12 +320,124 @@ async def delete_playlist(
         raise HTTPException(
             status_code=403, detail="Can not delete other user's playlist"
         )
-    session.delete(playlist)
+    deleted_playlist = PlaylistPublic.model_validate(playlist)
+    delete_playlist_cascade(session, playlist_id)
+    return deleted_playlist
+
+
+@router.post("/{playlist_id}/songs", response_model=PlaylistTracksChange)
+async def add_songs_to_playlist(
+    playlist_id: int,
+    songs: PlaylistSongsUpdate,
+    session: SessionDep,
+    current_user: CurrentUser,
+):
+    """Append songs in the given order, skipping ones already in the playlist."""
+    playlist = get_own_playlist(
+        session, playlist_id, current_user, "Can not change other user's playlist"
+    )
+    song_ids = list(dict.fromkeys(songs.song_ids))
+    found = set(session.exec(select(Songs.id).where(col(Songs.id).in_(song_ids))).all())
+    missing = [song_id for song_id in song_ids if song_id not in found]
+    if missing:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Songs not found: {', '.join(map(str, missing))}",
+        )
+    existing = set(
+        session.exec(
+            select(Playlist_Songs.song_id).where(
+                Playlist_Songs.playlist_id == playlist_id,
+                col(Playlist_Songs.song_id).in_(song_ids),
+            )
+        ).all()
+    )
+    new_song_ids = [song_id for song_id in song_ids if song_id not in existing]
+
+    added = append_tracks(session, playlist_id, new_song_ids)
+    touch_playlist(session, playlist)
     session.commit()
-    return playlist
+    entity_cache.invalidate("playlist", playlist_id)
+    return PlaylistTracksChange(
+        playlist_id=playlist_id,
+        added=added,
+        skipped=[song_id for song_id in song_ids if song_id in existing],
+    )
 
 
-@router.post("/{playlist_id}/songs/{song_id}", response_model=DetailedPlaylistPublic)
+@router.delete("/{playlist_id}/songs", response_model=PlaylistTracksChange)
+async def remove_songs_from_playlist(
+    playlist_id: int,
+    songs: PlaylistSongsUpdate,
+    session: SessionDep,
+    current_user: CurrentUser,
+):
+    playlist = get_own_playlist(
+        session,
+        playlist_id,
+        current_user,
+        "Can not remove song from other user's playlist",
+    )
+    condition = (
+        Playlist_Songs.playlist_id == playlist_id,
+        col(Playlist_Songs.song_id).in_(songs.song_ids),
+    )
+    removed = set(
+        session.exec(select(Playlist_Songs.song_id).where(*condition)).all()
+    )
+    session.execute(
+        delete(Playlist_Songs)
+        .where(*condition)
+        .execution_options(synchronize_session=False)
+    )
+    touch_playlist(session, playlist)
+    session.commit()
+    entity_cache.invalidate("playlist", playlist_id)
+    return PlaylistTracksChange(
+        playlist_id=playlist_id,
+        removed=[song_id for song_id in songs.song_ids if song_id in removed],
+        skipped=[song_id for song_id in songs.song_ids if song_id not in removed],
+    )
+
+
+@router.put("/{playlist_id}/songs", response_model=PlaylistTracksChange)
+async def reorder_playlist_songs(
+    playlist_id: int,
+    songs: PlaylistSongsUpdate,
+    session: SessionDep,
+    current_user: CurrentUser,
+):
+    """Replace the track order; `song_ids` must list every track exactly once."""
+    playlist = get_own_playlist(
+        session, playlist_id, current_user, "Can not change other user's playlist"
+    )
+    current = set(
+        session.exec(
+            select(Playlist_Songs.song_id).where(
+                Playlist_Songs.playlist_id == playlist_id
+            )
+        ).all()
+    )
+    if len(songs.song_ids) != len(current) or set(songs.song_ids) != current:
+        raise HTTPException(
+            status_code=400,
+            detail="song_ids must contain every song of the playlist exactly once",
+        )
+    moved = [
+        PlaylistTrackPublic(song_id=song_id, position=(i + 1) * POSITION_GAP)
+        for i, song_id in enumerate(songs.song_ids)
+    ]
+    session.execute(
+        update(Playlist_Songs),
+        [{"playlist_id": playlist_id, **track.model_dump()} for track in moved],
+    )
+    touch_playlist(session, playlist)
+    session.commit()
+    entity_cache.invalidate("playlist", playlist_id)
+    return PlaylistTracksChange(playlist_id=playlist_id, moved=moved)
+
+
+@router.post("/{playlist_id}/songs/{song_id}", response_model=PlaylistTracksChange)
 async def add_song_to_playlist(
     playlist_id: int, song_id: int, session: SessionDep, current_user: CurrentUser
 ):
@@ -113,31 +451,59 @@ async def add_song_to_playlist(
         raise HTTPException(
             status_code=403, detail="Can not change other user's playlist"
         )
-    already_added = session.exec(
-        select(Playlist_Songs).where(
-            Playlist_Songs.playlist_id == playlist_id, Playlist_Songs.song_id == song_id
-        )
-    ).one_or_none()
+    already_added = session.get(Playlist_Songs, (playlist_id, song_id))
     if already_added:
         raise HTTPException(
             status_code=400, detail="Song has been added to playlist before"
         )
-    playlist_song_db = Playlist_Songs(playlist_id=playlist_id, song_id=song_id)
-    session.add(playlist_song_db)
+    added = append_tracks(session, playlist_id, [song_id])
+    touch_playlist(session, playlist)
     session.commit()
-    session.refresh(playlist)
+    entity_cache.invalidate("playlist", playlist_id)
+    return PlaylistTracksChange(playlist_id=playlist_id, added=added)
+
+
+@router.patch("/{playlist_id}/songs/{song_id}", response_model=PlaylistTracksChange)
+async def move_playlist_song(
+    playlist_id: int,
+    song_id: int,
+    move: PlaylistSongMove,
+    session: SessionDep,
+    current_user: CurrentUser,
+):
+    """Move one track to `index` (0-based) without touching the other rows."""
+    playlist = get_own_playlist(
+        session, playlist_id, current_user, "Can not change other user's playlist"
+    )
+    playlist_song = session.get(Playlist_Songs, (playlist_id, song_id))
+    if not playlist_song:
+        raise HTTPException(
+            status_code=404, detail="Song has not been added to playlist before"
+        )
+    position = position_at(session, playlist_id, song_id, move.index)
+    if position is None:
+        renumber_tracks(session, playlist_id)
+        position = position_at(session, playlist_id, song_id, move.index)
 
-    playlist_songs = [song.song for song in playlist.songs]
-    return DetailedPlaylistPublic(
-        id=playlist.id,
-        created_at=playlist.created_at,
-        updated_at=playlist.updated_at,
-        name=playlist.name,
-        songs=playlist_songs,
+    session.execute(
+        update(Playlist_Songs)
+        .where(
+            Playlist_Songs.playlist_id == playlist_id,
+            Playlist_Songs.song_id == song_id,
+        )
+        .values(position=position)
+        .execution_options(synchronize_session=False)
+    )
+    touch_playlist(session, playlist)
+    session.commit()
+    entity_cache.invalidate("playlist", playlist_id)
+    return PlaylistTracksChange(
+        playlist_id=playlist_id,
+        moved=[PlaylistTrackPublic(song_id=song_id, position=position)],
     )
 
 
-@router.delete("/{playlist_id}/songs/{song_id}", response_model=DetailedPlaylistPublic)
+@router.delete("/{playlist_id}/songs/{song_id}", response_model=PlaylistTracksChange)
 async def remove_song_from_playlist(
     playlist_id: int, song_id: int, session: SessionDep, current_user: CurrentUser
 ):
@@ -157,14 +523,7 @@ async def remove_song_from_playlist(
             status_code=404, detail="Song has not been added to playlist before"
         )
     session.delete(playlist_song)
+    touch_playlist(session, playlist)
     session.commit()
-    session.refresh(playlist)
-
-    playlist_songs = [song.song for song in playlist.songs]
-    return DetailedPlaylistPublic(
-        id=playlist.id,
-        created_at=playlist.created_at,
-        updated_at=playlist.updated_at,
-        name=playlist.name,
-        songs=playlist_songs,
-    )
+    entity_cache.invalidate("playlist", playlist_id)
+    return PlaylistTracksChange(playlist_id=playlist_id, removed=[song_id])
@@ -1,15 +1,35 @@
-from fastapi import APIRouter, HTTPException, Body, Query
+from fastapi import APIRouter, HTTPException, Body, Query, Request
 from typing import Annotated
 from sqlmodel import SQLModel, select
+from sqlalchemy.orm import selectinload
 
-from ..models import Posts, Post_Likes
+from ..models import Posts, Post_Likes, Users
 from ..dependencies.db import SessionDep
 from ..dependencies.auth import CurrentUser
 from ..response_models import Response, PostPublic
+from ..cache import entity_cache
+from ..counters import increment
+from ..likes import add_like, remove_like, target_exists
+from ..feed import fan_out_post, remove_post
+from ..serialization import list_response
+from ..http_caching import (
+    as_utc,
+    entity_response,
+    has_validators,
+    is_not_modified,
+    make_etag,
+    not_modified_response,
+)
 
 router = APIRouter(prefix="/posts", tags=["posts"])
 
 
+def post_validators(post_id: int, updated_at, user_updated_at):
+    """ETag and Last-Modified of a post, which embeds its author."""
+    last_modified = max(as_utc(updated_at), as_utc(user_updated_at))
+    return make_etag("post", post_id, updated_at, user_updated_at), last_modified
+
+
 class PostCreate(SQLModel):
     title: str
     content: str
@@ -35,16 +55,43 @@ async def get_all_posts(
         .order_by(Posts.created_at.desc())
         .offset(offset)
         .limit(itemPerPage)
+        .options(selectinload(Posts.user))
     ).all()
-    return posts
+    return list_response(PostPublic, posts)
 
 
 @router.get("/{post_id}", response_model=PostPublic)
-async def get_post(post_id: int, session: SessionDep):
-    post = session.get(Posts, post_id)
+async def get_post(post_id: int, request: Request, session: SessionDep):
+    cached = entity_cache.get("post", post_id)
+    if cached is not None:
+        return entity_response(request, cached)
+
+    if has_validators(request):
+        validators = session.exec(
+            select(Posts.updated_at, Users.updated_at)
+            .join(Users, Posts.user_id == Users.id)
+            .where(Posts.id == post_id)
+        ).one_or_none()
+        if validators is None:
+            raise HTTPException(status_code=404, detail="Post not found")
+        etag, last_modified = post_validators(post_id, *validators)
+        if is_not_modified(request, etag, last_modified):
+            return not_modified_response(etag, last_modified)
+
+    post = session.get(Posts, post_id, options=[selectinload(Posts.user)])
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
-    return post
+    etag, last_modified = post_validators(
+        post_id, post.updated_at, post.user.updated_at
+    )
+    cached = entity_cache.set(
+        "post",
+        post_id,
+        PostPublic.model_validate(post),
+        etag=etag,
+        last_modified=last_modified,
+    )
+    return entity_response(request, cached)
 
 
 @router.post("/", response_model=PostPublic)
@@ -57,6 +104,8 @@ async def create_post(
     post = PostCreate(title=title, content=content, user_id=current_user.id)
     db_post = Posts.model_validate(post)
     session.add(db_post)
+    session.flush()
+    fan_out_post(session, db_post, session.get(Users, current_user.id))
     session.commit()
     session.refresh(db_post)
     return db_post
@@ -76,6 +125,7 @@ async def update_post(
     session.add(post_db)
     session.commit()
     session.refresh(post_db)
+    entity_cache.invalidate("post", post_id)
     return post_db
 
 
@@ -93,22 +143,63 @@ async def like_or_unlike_post(
     ).one_or_none()
     if already_liked is not None:
         session.delete(already_liked)
-        post.like_count -= 1
-        session.add(post)
+        increment(session, Posts.like_count, post_id, -1)
 
         session.commit()
+        entity_cache.invalidate("post", post_id)
         return Response(detail=f"Successfully liked post with id {post_id}")
     else:
         post_like = Post_Likes(user_id=current_user.id, post_id=post_id)
         session.add(post_like)
-
-        post.like_count += 1
-        session.add(post)
+        increment(session, Posts.like_count, post_id)
 
         session.commit()
+        entity_cache.invalidate("post", post_id)
         return Response(detail=f"Successfully liked post with id {post_id}")
 
 
+@router.put("/{post_id}/liked")
+async def like_post(post_id: int, session: SessionDep, current_user: CurrentUser):
+    """
+    Idempotent like: liking an already liked post changes nothing.
+
+    `PUT /posts/{post_id}/like` keeps toggling, for existing clients.
+    """
+    liked = add_like(
+        session,
+        Post_Likes,
+        Post_Likes.post_id,
+        Posts.like_count,
+        current_user.id,
+        post_id,
+    )
+    if not liked and not target_exists(session, Posts, post_id):
+        raise HTTPException(status_code=404, detail="Post not found")
+    session.commit()
+    if liked:
+        entity_cache.invalidate("post", post_id)
+    return Response(detail=f"Successfully liked post with id {post_id}")
+
+
+@router.delete("/{post_id}/liked")
+async def unlike_post(post_id: int, session: SessionDep, current_user: CurrentUser):
+    """Idempotent unlike: unliking a post that is not liked changes nothing."""
+    unliked = remove_like(
+        session,
+        Post_Likes,
+        Post_Likes.post_id,
+        Posts.like_count,
+        current_user.id,
+        post_id,
+    )
+    if not unliked and not target_exists(session, Posts, post_id):
+        raise HTTPException(status_code=404, detail="Post not found")
+    session.commit()
+    if unliked:
+        entity_cache.invalidate("post", post_id)
+    return Response(detail=f"Successfully unliked post with id {post_id}")
+
+
 @router.delete("/{post_id}", response_model=PostPublic)
 async def delete_post(post_id: int, session: SessionDep, current_user: CurrentUser):
     post = session.get(Posts, post_id)
@@ -116,6 +207,8 @@ async def delete_post(post_id: int, session: SessionDep, current_user: CurrentUs
         raise HTTPException(status_code=404, detail="Post not found")
     if post.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Can not delete other user's post")
+    remove_post(session, post_id)
     session.delete(post)
     session.commit()
+    entity_cache.invalidate("post", post_id)
     return post
@@ -1,86 +1,91 @@
+from datetime import datetime, timedelta, timezone
+
 from fastapi import APIRouter, HTTPException
-from sqlmodel import select
-import os
+from sqlmodel import select, col
+from sqlalchemy.orm import selectinload
 
-from ..models import Songs, Histories
+from ..config import config
+from ..models import Songs, User_Recommendations
 from ..dependencies.auth import CurrentUser
 from ..dependencies.db import SessionDep
 from ..response_models import SongPublic
-from ..ml.ml_models.models import load_model, load_encoder, predict
+from ..serialization import list_response
+from ..listening_history import recent_histories
+from ..model_registry import model_registry
 
 router = APIRouter(prefix="/songs", tags=["songs"])
 
+RECOMMENDATION_COUNT = 10
 
-# Get the path to the current file's directory
-current_dir = os.path.dirname(os.path.abspath(__file__))
-
-# Path to the ml folder
-ml_folder = os.path.join(current_dir, "..", "ml")
 
+def popular_songs(session: SessionDep, count: int) -> list[Songs]:
+    return session.exec(
+        select(Songs)
+        .order_by(Songs.popularity.desc())
+        .limit(count)
+        .options(selectinload(Songs.singer), selectinload(Songs.album))
+    ).all()
 
-genre_encoder = load_encoder(
-    os.path.join(ml_folder, "exported_models", "genre_encoder.pkl")
-)
-song_encoder = load_encoder(
-    os.path.join(ml_folder, "exported_models", "song_encoder.pkl")
-)
 
-model = load_model(os.path.join(ml_folder, "exported_models", "gru4rec_model.keras"))
+def precomputed_songs(session: SessionDep, user_id: int, count: int) -> list[Songs]:
+    """The user's rows from the batch job, empty if there are none or they are stale."""
+    fresh_since = datetime.now(timezone.utc) - timedelta(
+        hours=config.recommendations_max_age_hours
+    )
+    return session.exec(
+        select(Songs)
+        .join(User_Recommendations, User_Recommendations.song_id == Songs.id)
+        .where(
+            User_Recommendations.user_id == user_id,
+            User_Recommendations.generated_at >= fresh_since,
+        )
+        .order_by(User_Recommendations.position)
+        .limit(count)
+        .options(selectinload(Songs.singer), selectinload(Songs.album))
+    ).all()
 
 
 @router.get("/recommendations", response_model=list[SongPublic])
 async def get_recommendations(current_user: CurrentUser, session: SessionDep):
-    histories = session.exec(
-        select(Histories).where(Histories.user_id == current_user.id).limit(10)
-    ).all()
+    precomputed = precomputed_songs(session, current_user.id, RECOMMENDATION_COUNT)
+    if precomputed:
+        return list_response(SongPublic, precomputed)
 
-    # List of song IDs based on histories
-    song_id_sequence = [
-        history.song.ml_id for history in histories if history.song.ml_id is not None
-    ]
+    recommender = model_registry.get()
+    if recommender is None:
+        # Model still loading (or failed to load): serve the charts instead
+        return list_response(SongPublic, popular_songs(session, RECOMMENDATION_COUNT))
 
-    # List of genres based on histories
-    genre_id_sequence = [history.song.genre.split(", ") for history in histories]
+    # Same histories as the batch job, so both paths agree
+    song_id_sequence, genre_id_sequence = recent_histories(
+        session, [current_user.id]
+    ).get(current_user.id, ([], []))
 
-    # Encode the song ID sequence
     try:
-        encoded_song_id_sequence = song_encoder.transform(song_id_sequence)
-    except Exception as e:
-        return HTTPException(
-            status_code=400, detail=f"Failed to encode song ID sequence: {str(e)}"
+        predicted_sequence = await model_registry.run(
+            recommender.recommend,
+            song_id_sequence,
+            genre_id_sequence,
+            RECOMMENDATION_COUNT,
         )
-
-    encoded_genre_sequence = []
-    try:
-        for genre in genre_id_sequence:
-            # print(genre)
-            encoded_genre_sequence.append(genre_encoder.transform(genre))
-    except Exception as e:
-        return HTTPException(
-            status_code=400,
-            detail=f"Failed to encode genre sequence: {str(e)}",
-        )
-
-    # Predict
-    try:
-        predicted_sequence = predict(
-            model, encoded_song_id_sequence, encoded_genre_sequence, 10
+    except ValueError as e:
+        # Unknown song or genre label in the history
+        raise HTTPException(
+            status_code=400, detail=f"Failed to encode history: {str(e)}"
         )
-
-        # inverse transform the sequence
-        predicted_sequence = song_encoder.inverse_transform(predicted_sequence)
-        print("predicted", predicted_sequence)
     except Exception as e:
-        return HTTPException(
+        raise HTTPException(
             status_code=500,
             detail=f"Prediction failed: {str(e)}",
         )
 
-    # Return results
-    songs: list[Songs] = []
-
-    for ml_id in predicted_sequence:
-        song = session.exec(select(Songs).where(Songs.ml_id == ml_id)).one()
-        songs.append(song)
-
-    return songs
+    songs = session.exec(
+        select(Songs)
+        .where(col(Songs.ml_id).in_(predicted_sequence))
+        .options(selectinload(Songs.singer), selectinload(Songs.album))
+    ).all()
+    by_ml_id = {song.ml_id: song for song in songs}
+    return list_response(
+        SongPublic,
+        [by_ml_id[ml_id] for ml_id in predicted_sequence if ml_id in by_ml_id],
+    )
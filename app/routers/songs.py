@@ -1,16 +1,50 @@
-from fastapi import APIRouter, Form, UploadFile, File, HTTPException, Query
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Form,
+    UploadFile,
+    File,
+    HTTPException,
+    Query,
+    Request,
+)
+from fastapi.concurrency import run_in_threadpool
 from typing import Annotated
 from sqlmodel import SQLModel, select, col
 from datetime import datetime
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import selectinload, contains_eager, joinedload
 
-from ..models import Songs, Song_Likes, Users, Albums
+from ..models import Songs, Song_Likes, Users, Albums, Playlist_Songs
 from ..dependencies.auth import CurrentUser
 from ..dependencies.db import SessionDep
 from ..dependencies.cloud_storage import BucketDep
-from ..bucket_functions import upload_file, delete_file
-from ..response_models import Response, AlbumPublic, UserPublic, SongPublic
-from ..util_functions import calculate_song_popularity, calculate_song_duration
+from ..bucket_functions import upload_files, delete_file
+from ..blob_deletion import queue_blob_deletion
+from ..response_models import (
+    Response,
+    AlbumPublic,
+    UserPublic,
+    SongPublic,
+    SongBatchPublic,
+    NormalizedSongsPublic,
+)
+from ..util_functions import calculate_song_popularity, refresh_song_popularity
+from ..likes import add_like, remove_like, target_exists
+from ..cache import entity_cache
+from ..counters import increment
+from ..serialization import batch_response, list_response, song_list_response
+from ..dependencies.batch_ids import BatchIdsDep
+from ..dependencies.sparse_fields import SongListOptionsDep
+from ..http_caching import (
+    as_utc,
+    entity_response,
+    has_validators,
+    is_not_modified,
+    make_etag,
+    not_modified_response,
+)
+from ..audio_metadata import AudioMetadataReader
+from ..config import config
 
 router = APIRouter(prefix="/songs", tags=["songs"])
 
@@ -22,6 +56,10 @@ class SongCreate(SQLModel):
     popularity: float
     genre: str
     duration: int
+    bitrate: int | None = None
+    sample_rate: int | None = None
+    channels: int | None = None
+    content_hash: str | None = None
     cover: str
     cover_url: str
     song: str
@@ -50,9 +88,33 @@ class SongLikeCreate(SQLModel):
     song_id: int
 
 
-@router.get("/", response_model=list[SongPublic])
+def song_validators(song_id: int, updated_at, singer_updated_at, album_updated_at):
+    """ETag and Last-Modified of a song, which embeds its singer and album."""
+    versions = (updated_at, singer_updated_at, album_updated_at)
+    last_modified = max(as_utc(value) for value in versions if value is not None)
+    return make_etag("song", song_id, *versions), last_modified
+
+
+def cache_song(song: Songs):
+    etag, last_modified = song_validators(
+        song.id,
+        song.updated_at,
+        song.singer.updated_at,
+        song.album.updated_at if song.album is not None else None,
+    )
+    return entity_cache.set(
+        "song",
+        song.id,
+        SongPublic.model_validate(song),
+        etag=etag,
+        last_modified=last_modified,
+    )
+
+
+@router.get("/", response_model=list[SongPublic] | NormalizedSongsPublic)
 async def get_all_songs(
     session: SessionDep,
+    options: SongListOptionsDep,
     page: Annotated[int, Query(ge=1)] = 1,
     itemPerPage: Annotated[int, Query(ge=10, le=30)] = 10,
     user_id: int | None = None,
@@ -66,6 +128,7 @@ async def get_all_songs(
         select(Songs)
         .join(Albums, Songs.album_id == Albums.id, isouter=True)
         .join(Users, Songs.singer_id == Users.id)
+        .options(contains_eager(Songs.album), contains_eager(Songs.singer))
     )
 
     if user_id is not None:
@@ -87,15 +150,89 @@ async def get_all_songs(
 
     songs = session.exec(query.offset(offset).limit(itemPerPage)).all()
 
-    return songs
+    return song_list_response(songs, options)
+
+
+@router.get("/batch", response_model=SongBatchPublic)
+async def get_songs_batch(ids: BatchIdsDep, session: SessionDep):
+    """Songs for up to `batch_max_ids` ids in request order, plus the ids not found."""
+    cached = entity_cache.get_many("song", ids)
+    bodies = {id: entry.body for id, entry in cached.items()}
+    uncached = [id for id in ids if id not in bodies]
+    if uncached:
+        songs = session.exec(
+            select(Songs)
+            .where(col(Songs.id).in_(uncached))
+            .options(joinedload(Songs.singer), joinedload(Songs.album))
+        ).all()
+        for song in songs:
+            # Fill the cache on the way, the body is reused for this response
+            bodies[song.id] = cache_song(song).body
+    return batch_response(SongPublic, ids, [], bodies)
 
 
 @router.get("/{song_id}", response_model=SongPublic)
-async def get_song(song_id: int, session: SessionDep):
-    song = session.get(Songs, song_id)
+async def get_song(song_id: int, request: Request, session: SessionDep):
+    cached = entity_cache.get("song", song_id)
+    if cached is not None:
+        return entity_response(request, cached)
+
+    if has_validators(request):
+        validators = session.exec(
+            select(Songs.updated_at, Users.updated_at, Albums.updated_at)
+            .join(Users, Songs.singer_id == Users.id)
+            .join(Albums, Songs.album_id == Albums.id, isouter=True)
+            .where(Songs.id == song_id)
+        ).one_or_none()
+        if validators is None:
+            raise HTTPException(status_code=404, detail="Song not found")
+        etag, last_modified = song_validators(song_id, *validators)
+        if is_not_modified(request, etag, last_modified):
+            return not_modified_response(etag, last_modified)
+
+    song = session.get(
+        Songs, song_id, options=[joinedload(Songs.singer), joinedload(Songs.album)]
+    )
     if not song:
         raise HTTPException(status_code=404, detail="Song not found")
-    return song
+    return entity_response(request, cache_song(song))
+
+
+@router.get("/{song_id}/similar", response_model=list[SongPublic])
+async def get_similar_songs(
+    song_id: int,
+    session: SessionDep,
+    count: Annotated[int, Query(ge=1, le=50)] = 10,
+):
+    """Songs closest to this one in the recommender's item embedding space."""
+    ml_id = session.exec(select(Songs.ml_id).where(Songs.id == song_id)).one_or_none()
+    if ml_id is None:
+        # Unknown song, or a song the model was not trained on
+        raise HTTPException(status_code=404, detail="Song not found")
+
+    # Imported here so NumPy stays out of the app's import time
+    from ..similar_songs import get_index
+
+    index = await run_in_threadpool(get_index)
+    if index is None:
+        raise HTTPException(
+            status_code=503, detail="Similar songs index has not been built"
+        )
+    similar = await run_in_threadpool(
+        index.similar, ml_id, count, config.similar_songs_n_probe
+    )
+    if similar is None:
+        raise HTTPException(status_code=404, detail="Song not found")
+
+    songs = session.exec(
+        select(Songs)
+        .where(col(Songs.ml_id).in_(similar))
+        .options(selectinload(Songs.singer), selectinload(Songs.album))
+    ).all()
+    by_ml_id = {song.ml_id: song for song in songs}
+    return list_response(
+        SongPublic, [by_ml_id[ml_id] for ml_id in similar if ml_id in by_ml_id]
+    )
 
 
 @router.post("/", response_model=SongPublic)
@@ -150,24 +287,33 @@ async def create_song(
                 detail="Album not found",
             )
 
+    folder_song = "song_file"
+    folder_cover = "song_cover"
+    song_reader = AudioMetadataReader(song.file)
     try:
-        folder_song = "song_file"
-        folder_cover = "song_cover"
-        song_blob_name, song_public_url = upload_file(
-            bucket, current_user.id, song, folder_song
-        )
-        cover_blob_name, cover_public_url = upload_file(
-            bucket, current_user.id, cover, folder_cover
+        [(song_blob_name, song_public_url), (cover_blob_name, cover_public_url)] = (
+            await upload_files(
+                bucket,
+                current_user.id,
+                [(song, folder_song, song_reader), (cover, folder_cover)],
+            )
         )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
-        duration = calculate_song_duration(song)
+    try:
+        metadata = await run_in_threadpool(song_reader.finalize)
 
         song_data = SongCreate(
             name=name,
             singer_id=current_user.id,
             popularity=0,
             genre=genre,
-            duration=duration,
+            duration=metadata.duration,
+            bitrate=metadata.bitrate,
+            sample_rate=metadata.sample_rate,
+            channels=metadata.channels,
+            content_hash=metadata.content_hash,
             cover=cover_blob_name,
             cover_url=cover_public_url,
             song=song_blob_name,
@@ -181,13 +327,13 @@ async def create_song(
         session.add(db_song)
         session.commit()
         session.refresh(db_song)
+        entity_cache.invalidate("album", db_song.album_id)
+        entity_cache.invalidate("album_song_count", db_song.album_id)
         return db_song
     except Exception as e:
         session.rollback()
-        if song_blob_name:
-            delete_file(bucket, song_blob_name)
-        if cover_blob_name:
-            delete_file(bucket, cover_blob_name)
+        delete_file(bucket, song_blob_name)
+        delete_file(bucket, cover_blob_name)
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
 
@@ -227,22 +373,26 @@ async def update_song(
         folder_cover = "song_cover"
         song = SongUpdate()
         if cover is not None:
-            cover_blob_name, public_url = upload_file(
-                bucket, current_user.id, cover, folder_cover
+            [(cover_blob_name, public_url)] = await upload_files(
+                bucket, current_user.id, [(cover, folder_cover)]
             )
 
-            delete_file(bucket, song.cover)
+            queue_blob_deletion(session, song_db.cover)
 
             song.cover = cover_blob_name
             song.cover_url = public_url
         if name is not None:
-            song_db.name = name
+            song.name = name
         if genre is not None:
-            song_db.genre = genre
+            song.genre = genre
 
+        song_update_data = song.model_dump(exclude_unset=True)
+        song_db.sqlmodel_update(song_update_data)
         session.add(song_db)
         session.commit()
         session.refresh(song_db)
+        entity_cache.invalidate("song", song_id)
+        entity_cache.invalidate("album", song_db.album_id)
         return song_db
     except Exception as e:
         session.rollback()
@@ -260,14 +410,72 @@ async def delete_song(song_id: int, session: SessionDep, current_user: CurrentUs
         raise HTTPException(status_code=403, detail="Cannot delete another user's song")
 
     try:
+        album_id = song_db.album_id
+        playlist_ids = session.exec(
+            select(Playlist_Songs.playlist_id).where(Playlist_Songs.song_id == song_id)
+        ).all()
         session.delete(song_db)
         session.commit()
+        entity_cache.invalidate("song", song_id)
+        entity_cache.invalidate("album", album_id)
+        entity_cache.invalidate("album_song_count", album_id)
+        entity_cache.invalidate("playlist", *playlist_ids)
         return song_db
     except Exception as e:
         session.rollback()
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
 
+@router.put("/{song_id}/like")
+async def like_song(
+    song_id: int,
+    session: SessionDep,
+    current_user: CurrentUser,
+    background_tasks: BackgroundTasks,
+):
+    """Idempotent like: liking an already liked song changes nothing."""
+    liked = add_like(
+        session,
+        Song_Likes,
+        Song_Likes.song_id,
+        Songs.like_count,
+        current_user.id,
+        song_id,
+    )
+    if not liked and not target_exists(session, Songs, song_id):
+        raise HTTPException(status_code=404, detail="Song not found")
+    session.commit()
+    if liked:
+        entity_cache.invalidate("song", song_id)
+        background_tasks.add_task(refresh_song_popularity, song_id)
+    return Response(detail=f"Successfully liked song with id {song_id}")
+
+
+@router.delete("/{song_id}/like")
+async def unlike_song(
+    song_id: int,
+    session: SessionDep,
+    current_user: CurrentUser,
+    background_tasks: BackgroundTasks,
+):
+    """Idempotent unlike: unliking a song that is not liked changes nothing."""
+    unliked = remove_like(
+        session,
+        Song_Likes,
+        Song_Likes.song_id,
+        Songs.like_count,
+        current_user.id,
+        song_id,
+    )
+    if not unliked and not target_exists(session, Songs, song_id):
+        raise HTTPException(status_code=404, detail="Song not found")
+    session.commit()
+    if unliked:
+        entity_cache.invalidate("song", song_id)
+        background_tasks.add_task(refresh_song_popularity, song_id)
+    return Response(detail=f"Successfully unliked song with id {song_id}")
+
+
 @router.post("/{song_id}/like")
 async def like_or_unlike_song(
     song_id: int, session: SessionDep, current_user: CurrentUser
@@ -282,10 +490,10 @@ async def like_or_unlike_song(
     ).one_or_none()
     if already_liked is not None:
         session.delete(already_liked)
-        song.like_count -= 1
-        session.add(song)
+        increment(session, Songs.like_count, song_id, -1)
 
         session.commit()
+        entity_cache.invalidate("song", song_id)
 
         calculate_song_popularity(session, song)
 
@@ -294,11 +502,10 @@ async def like_or_unlike_song(
         song_like = SongLikeCreate(user_id=current_user.id, song_id=song_id)
         song_like_db = Song_Likes.model_validate(song_like)
         session.add(song_like_db)
-
-        song.like_count += 1
-        session.add(song)
+        increment(session, Songs.like_count, song_id)
 
         session.commit()
+        entity_cache.invalidate("song", song_id)
 
         calculate_song_popularity(session, song)
 
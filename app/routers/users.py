@@ -1,20 +1,44 @@
-from fastapi import APIRouter, HTTPException, Query
-from pydantic import EmailStr
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Query
+from pydantic import EmailStr, AwareDatetime
 from typing import Annotated
-from sqlmodel import SQLModel, Field, select
+from datetime import datetime, timezone
+from sqlmodel import SQLModel, Field, select, col
+from sqlalchemy import insert
+from sqlalchemy.orm import selectinload
 
 from ..dependencies.db import SessionDep
 from ..dependencies.auth import pwd_context, CurrentUser
-from ..models import Users, Follows, Histories, Song_Likes, Songs, Post_Likes, Posts
+from ..models import (
+    Albums,
+    Users,
+    Follows,
+    Histories,
+    Song_Likes,
+    Songs,
+    Post_Likes,
+    Posts,
+    Playlists,
+    Playlist_Songs,
+)
 from ..response_models import (
     Response,
     DetailedUserPublic,
     UserPublic,
+    UserBatchPublic,
     SongPublic,
     HistoryPublic,
     PostPublic,
+    NormalizedSongsPublic,
 )
-from ..util_functions import calculate_song_popularity
+from ..util_functions import calculate_song_popularity, refresh_song_popularity
+from ..config import config
+from ..delete_functions import delete_user_cascade
+from ..counters import increment
+from ..cache import entity_cache
+from ..feed import backfill_author, remove_author
+from ..serialization import batch_response, list_response, song_list_response
+from ..dependencies.batch_ids import BatchIdsDep
+from ..dependencies.sparse_fields import SongListOptionsDep
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -41,6 +65,18 @@ class HistoryCreate(SQLModel):
     song_id: int
 
 
+class HistoryEvent(SQLModel):
+    song_id: int
+    played_at: AwareDatetime
+
+
+class HistoryBatch(SQLModel):
+    events: Annotated[
+        list[HistoryEvent],
+        Field(min_length=1, max_length=config.history_batch_max_events),
+    ]
+
+
 class FollowCreate(SQLModel):
     user_id: int
     follower_id: int
@@ -56,7 +92,14 @@ async def get_all_users(
     users = session.exec(
         select(Users).order_by(Users.id).offset(offset).limit(itemPerPage)
     ).all()
-    return users
+    return list_response(UserPublic, users)
+
+
+@router.get("/batch", response_model=UserBatchPublic)
+async def get_users_batch(ids: BatchIdsDep, session: SessionDep):
+    """Users for up to `batch_max_ids` ids in request order, plus the ids not found."""
+    users = session.exec(select(Users).where(col(Users.id).in_(ids))).all()
+    return batch_response(UserPublic, ids, users)
 
 
 @router.get("/details", response_model=DetailedUserPublic)
@@ -110,6 +153,28 @@ async def update_user(
     session.add(user_db)
     session.commit()
     session.refresh(user_db)
+    # Songs, albums and posts embed their singer or author, and playlists
+    # embed the singer of every track
+    entity_cache.invalidate(
+        "song", *session.exec(select(Songs.id).where(Songs.singer_id == user_id)).all()
+    )
+    entity_cache.invalidate(
+        "album",
+        *session.exec(select(Albums.id).where(Albums.singer_id == user_id)).all(),
+    )
+    entity_cache.invalidate(
+        "post", *session.exec(select(Posts.id).where(Posts.user_id == user_id)).all()
+    )
+    entity_cache.invalidate(
+        "playlist",
+        *session.exec(select(Playlists.id).where(Playlists.user_id == user_id)).all(),
+        *session.exec(
+            select(Playlist_Songs.playlist_id)
+            .join(Songs, Playlist_Songs.song_id == Songs.id)
+            .where(Songs.singer_id == user_id)
+            .distinct()
+        ).all(),
+    )
     return user_db
 
 
@@ -124,9 +189,9 @@ async def delete_user(
     user = session.get(Users, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    session.delete(user)
-    session.commit()
-    return user
+    deleted_user = DetailedUserPublic.model_validate(user)
+    delete_user_cascade(session, user_id)
+    return deleted_user
 
 
 @router.post("/follow/{user_id}")
@@ -140,13 +205,10 @@ async def follow_user(user_id: int, session: SessionDep, current_user: CurrentUs
     db_follows = Follows.model_validate(follow)
     session.add(db_follows)
 
-    current_user_db = session.get(Users, current_user.id)
-    current_user_db.following_count += 1
-    session.add(current_user_db)
-
-    user.follower_count += 1
-    session.add(user)
+    increment(session, Users.following_count, current_user.id)
+    increment(session, Users.follower_count, user_id)
 
+    backfill_author(session, current_user.id, user)
     session.commit()
     return Response(detail=f"Successfully followed user with id {user_id}")
 
@@ -165,13 +227,10 @@ async def unfollow_user(user_id: int, session: SessionDep, current_user: Current
         raise HTTPException(status_code=400, detail="You haven't followed this account")
     session.delete(follow)
 
-    current_user_db = session.get(Users, current_user.id)
-    current_user_db.following_count -= 1
-    session.add(current_user_db)
-
-    user.follower_count -= 1
-    session.add(user)
+    increment(session, Users.following_count, current_user.id, -1)
+    increment(session, Users.follower_count, user_id, -1)
 
+    remove_author(session, current_user.id, user_id)
     session.commit()
     return Response(detail=f"Successfully unfollowed user with id {user_id}")
 
@@ -187,15 +246,15 @@ async def get_followers(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     offset = (page - 1) * itemPerPage
-    followers = session.exec(
-        select(Follows)
+    follower_users = session.exec(
+        select(Users)
+        .join(Follows, Follows.follower_id == Users.id)
         .where(Follows.user_id == user_id)
         .order_by(Follows.created_at.desc())
         .offset(offset)
         .limit(itemPerPage)
     ).all()
-    follower_users = [follow.follower_user for follow in followers]
-    return follower_users
+    return list_response(UserPublic, follower_users)
 
 
 @router.get("/{user_id}/followings", response_model=list[UserPublic])
@@ -209,21 +268,24 @@ async def get_followings(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     offset = (page - 1) * itemPerPage
-    followings = session.exec(
-        select(Follows)
+    following_users = session.exec(
+        select(Users)
+        .join(Follows, Follows.user_id == Users.id)
         .where(Follows.follower_id == user_id)
         .order_by(Follows.created_at.desc())
         .offset(offset)
         .limit(itemPerPage)
     ).all()
-    following_users = [follow.followed_user for follow in followings]
-    return following_users
+    return list_response(UserPublic, following_users)
 
 
-@router.get("/{user_id}/liked_songs", response_model=list[SongPublic])
+@router.get(
+    "/{user_id}/liked_songs", response_model=list[SongPublic] | NormalizedSongsPublic
+)
 async def get_liked_songs(
     user_id: int,
     session: SessionDep,
+    options: SongListOptionsDep,
     page: Annotated[int, Query(ge=1)] = 1,
     itemPerPage: Annotated[int, Query(ge=10, le=30)] = 10,
 ):
@@ -231,15 +293,16 @@ async def get_liked_songs(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     offset = (page - 1) * itemPerPage
-    result = session.exec(
-        select(Song_Likes)
+    liked_songs = session.exec(
+        select(Songs)
+        .join(Song_Likes, Song_Likes.song_id == Songs.id)
         .where(Song_Likes.user_id == user_id)
         .order_by(Song_Likes.created_at.desc())
         .offset(offset)
         .limit(itemPerPage)
+        .options(selectinload(Songs.singer), selectinload(Songs.album))
     ).all()
-    liked_songs = [song.song for song in result]
-    return liked_songs
+    return song_list_response(liked_songs, options)
 
 
 @router.get("/{user_id}/liked_posts", response_model=list[PostPublic])
@@ -253,16 +316,16 @@ async def get_liked_posts(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     offset = (page - 1) * itemPerPage
-    result = session.exec(
-        select(Post_Likes)
-        .join(Posts, Posts.id == Post_Likes.post_id)
+    liked_posts = session.exec(
+        select(Posts)
+        .join(Post_Likes, Posts.id == Post_Likes.post_id)
         .where(Posts.user_id == user_id)
         .order_by(Posts.created_at.desc())
         .offset(offset)
         .limit(itemPerPage)
+        .options(selectinload(Posts.user))
     ).all()
-    liked_posts = [post.post for post in result]
-    return liked_posts
+    return list_response(PostPublic, liked_posts)
 
 
 @router.get("/{user_id}/history", response_model=list[HistoryPublic])
@@ -287,11 +350,48 @@ async def get_history(
         .order_by(Histories.created_at.desc())
         .offset(offset)
         .limit(itemPerPage)
+        .options(
+            selectinload(Histories.song).selectinload(Songs.singer),
+            selectinload(Histories.song).selectinload(Songs.album),
+        )
     ).all()
-    history_songs = [
-        {"song": item.song, "created_at": item.created_at} for item in history
-    ]
-    return history_songs
+    return list_response(HistoryPublic, history)
+
+
+@router.post("/history/batch")
+async def create_history_batch(
+    batch: HistoryBatch,
+    session: SessionDep,
+    current_user: CurrentUser,
+    background_tasks: BackgroundTasks,
+):
+    """Record plays made offline, keeping the time each song was played."""
+    song_ids = {event.song_id for event in batch.events}
+    found = set(session.exec(select(Songs.id).where(col(Songs.id).in_(song_ids))).all())
+    missing = song_ids - found
+    if missing:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Songs not found: {', '.join(map(str, sorted(missing)))}",
+        )
+    now = datetime.now(timezone.utc)
+    session.execute(
+        insert(Histories),
+        [
+            {
+                "user_id": current_user.id,
+                "song_id": event.song_id,
+                # Clamp clock skew on the device so plays never sort as future
+                "created_at": min(event.played_at.astimezone(timezone.utc), now),
+            }
+            for event in batch.events
+        ],
+    )
+    session.commit()
+
+    background_tasks.add_task(refresh_song_popularity, *sorted(song_ids))
+
+    return Response(detail=f"Successfully added {len(batch.events)} songs to history")
 
 
 @router.post("/history/{song_id}")
@@ -0,0 +1,96 @@
+"""
+Fast serialization path for list endpoints.
+
+Returning ORM objects with `response_model=list[...]` makes FastAPI validate
+every row, convert it to plain Python with `jsonable_encoder` and then encode it
+with the standard library. Here the response models are built straight from the
+query rows with a cached `TypeAdapter` and dumped to JSON bytes by pydantic-core
+in a single pass.
+"""
+
+from functools import cache
+from typing import Any, Iterable
+import json
+
+from fastapi import Response
+from pydantic import TypeAdapter
+
+from .dependencies.sparse_fields import SongListOptions
+from .models import Songs
+from .response_models import NormalizedSongsPublic, SongPublic
+
+
+@cache
+def type_adapter(tp: Any) -> TypeAdapter:
+    return TypeAdapter(tp)
+
+
+def list_response(model: type, rows: Iterable[Any]) -> Response:
+    adapter = type_adapter(list[model])
+    items = adapter.validate_python(list(rows), from_attributes=True)
+    return Response(content=adapter.dump_json(items), media_type="application/json")
+
+
+def song_list_response(songs: list[Songs], options: SongListOptions) -> Response:
+    """
+    Serialize songs honouring the `fields=` and `include=` query options.
+
+    With `include`, each song carries `singer_id` / `album_id` and the
+    referenced users and albums are sent once in side-loaded maps, instead of
+    being repeated inside every song.
+    """
+    if not options.include:
+        adapter = type_adapter(list[SongPublic])
+        items = adapter.validate_python(list(songs), from_attributes=True)
+        include = {"__all__": options.fields} if options.fields else None
+        return Response(
+            content=adapter.dump_json(items, include=include),
+            media_type="application/json",
+        )
+
+    users = {}
+    albums = {}
+    for song in songs:
+        if "users" in options.include:
+            users.setdefault(song.singer_id, song.singer)
+        if "albums" in options.include and song.album_id is not None:
+            albums.setdefault(song.album_id, song.album)
+
+    adapter = type_adapter(NormalizedSongsPublic)
+    payload = adapter.validate_python(
+        {"songs": list(songs), "users": users, "albums": albums},
+        from_attributes=True,
+    )
+    include = None
+    if options.fields:
+        include = {"songs": {"__all__": options.fields}, "users": True, "albums": True}
+    return Response(
+        content=adapter.dump_json(payload, include=include),
+        media_type="application/json",
+    )
+
+
+def batch_response(
+    model: type,
+    ids: list[int],
+    rows: Iterable[Any],
+    cached: dict[int, bytes] | None = None,
+) -> Response:
+    """
+    `{"items": [...], "missing": [...]}` with items in the order of `ids`.
+
+    `cached` holds already serialized items (e.g. entity cache bodies), which
+    are spliced into the output as they are.
+    """
+    adapter = type_adapter(model)
+    bodies = dict(cached or {})
+    for row in rows:
+        bodies[row.id] = adapter.dump_json(
+            adapter.validate_python(row, from_attributes=True)
+        )
+    items = b",".join(bodies[id] for id in ids if id in bodies)
+    missing = json.dumps([id for id in ids if id not in bodies]).encode()
+    return Response(
+        content=b'{"items":[' + items + b'],"missing":' + missing + b"}",
+        media_type="application/json",
+    )
@@ -0,0 +1,169 @@
+"""
+"Similar songs" from the item embeddings learned by GRU4REC.
+
+`IVFIndex` is an inverted-file index over L2-normalized embeddings, so the
+dot product is the cosine similarity. Spherical k-means splits the catalog
+into `n_lists` clusters. The vectors are stored grouped by cluster, so one
+cluster is a contiguous slice. A query scores the centroids, then scans only
+the `n_probe` closest clusters, instead of the whole catalog. Raising
+`n_probe` trades latency for recall; `benchmarks.similar_songs` measures
+both.
+
+The index is built offline by `python -m app.jobs.build_similar_songs`. It is
+saved as `.npy` files and opened with `mmap_mode="r"` on the first request,
+so loading is cheap and the pages are shared between workers. Every build is
+written to a new directory that `INDEX_DIR` is switched to atomically, so the
+files a worker has mapped are never rewritten.
+"""
+
+import json
+import os
+import threading
+
+import numpy as np
+
+from .config import config
+from .ml.ml_models.numpy_serving import publish_directory
+from .model_registry import EXPORTED_MODELS_DIR
+
+INDEX_DIR = os.path.join(
+    config.recommender_model_dir or EXPORTED_MODELS_DIR, "similar_songs"
+)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the `k` largest scores, best first."""
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def assign(vectors: np.ndarray, centroids: np.ndarray, chunk: int = 65536):
+    """Closest centroid of every vector, in chunks to bound the score matrix."""
+    return np.concatenate(
+        [
+            np.argmax(vectors[start : start + chunk] @ centroids.T, axis=1)
+            for start in range(0, len(vectors), chunk)
+        ]
+    )
+
+
+class IVFIndex:
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        vectors: np.ndarray,
+        items: np.ndarray,
+        offsets: np.ndarray,
+        ml_ids: list[str],
+    ):
+        # vectors[offsets[i]:offsets[i + 1]] belong to centroid i; items maps a
+        # stored row back to its embedding row, which is also the song encoder
+        # class index of `ml_ids`
+        self.centroids = centroids
+        self.vectors = vectors
+        self.items = items
+        self.offsets = offsets
+        self.ml_ids = ml_ids
+        self.row_of = {ml_ids[item]: row for row, item in enumerate(items)}
+
+    @classmethod
+    def build(
+        cls,
+        embeddings: np.ndarray,
+        ml_ids: list[str],
+        n_lists: int | None = None,
+        iterations: int = 20,
+        seed: int = 0,
+    ):
+        vectors = normalize(embeddings)
+        n_lists = min(n_lists or max(1, int(np.sqrt(len(vectors)))), len(vectors))
+        rng = np.random.default_rng(seed)
+        centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)]
+        for _ in range(iterations):
+            labels = assign(vectors, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, vectors)
+            empty = np.bincount(labels, minlength=n_lists) == 0
+            # Re-seed empty clusters with random vectors
+            sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+            centroids = normalize(sums)
+
+        labels = assign(vectors, centroids)
+        order = np.argsort(labels, kind="stable")
+        offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(labels, minlength=n_lists))]
+        )
+        return cls(centroids, vectors[order], order, offsets, ml_ids)
+
+    def save(self, directory: str = INDEX_DIR):
+        """Write the index as a new version of `directory`, see `publish_directory`."""
+
+        def write(path: str):
+            for name in ("centroids", "vectors", "items", "offsets"):
+                np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+            with open(os.path.join(path, "ml_ids.json"), "w") as fd:
+                json.dump(self.ml_ids, fd)
+
+        publish_directory(directory, write)
+
+    @classmethod
+    def load(cls, directory: str = INDEX_DIR):
+        # Resolve the link once, so a concurrent build cannot mix versions
+        directory = os.path.realpath(directory)
+        arrays = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+            for name in ("centroids", "vectors", "items", "offsets")
+        }
+        with open(os.path.join(directory, "ml_ids.json")) as fd:
+            ml_ids = json.load(fd)
+        return cls(ml_ids=ml_ids, **arrays)
+
+    def search(
+        self, query: np.ndarray, k: int, n_probe: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Stored rows and scores of the approximate `k` nearest neighbours."""
+        lists = top_k(self.centroids @ query, n_probe)
+        rows = np.concatenate(
+            [np.arange(self.offsets[i], self.offsets[i + 1]) for i in lists]
+        )
+        scores = self.vectors[rows] @ query
+        best = top_k(scores, k)
+        return rows[best], scores[best]
+
+    def search_exact(self, query: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Brute force over the whole catalog, the reference for recall."""
+        scores = self.vectors @ query
+        best = top_k(scores, k)
+        return best, scores[best]
+
+    def similar(self, ml_id: str, count: int, n_probe: int) -> list[str] | None:
+        """ml_ids of the songs closest to `ml_id`, or None if it has no embedding."""
+        row = self.row_of.get(ml_id)
+        if row is None:
+            return None
+        rows, _ = self.search(np.asarray(self.vectors[row]), count + 1, n_probe)
+        return [self.ml_ids[self.items[r]] for r in rows if r != row][:count]
+
+
+_index: IVFIndex | None = None
+_lock = threading.Lock()
+
+
+def get_index() -> IVFIndex | None:
+    """The index built by the offline job, opened on first use; None if not built."""
+    global _index
+    if _index is None:
+        with _lock:
+            if _index is None and os.path.isdir(INDEX_DIR):
+                _index = IVFIndex.load(INDEX_DIR)
+    return _index
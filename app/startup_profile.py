@@ -0,0 +1,171 @@
+"""
+Startup profiling: time and memory cost of each import and initialization step.
+
+Usage:
+    python -m app.startup_profile [--output startup_profile.json]
+        [--with-network] [--with-model] [--top 25]
+
+Each step runs in this fresh process in the order the server would run it,
+and the report records its wall time and the growth of resident memory. The
+step list covers config, app imports and the lazily created resources. The
+engine, bucket and model steps are opt-in because they need credentials,
+network access or TensorFlow. The report also lists the slowest individual
+modules, measured by importing `app.main` in a child process under
+`python -X importtime`.
+
+Run it before importing anything else from `app`, otherwise the import steps
+measure nothing.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+def current_rss_bytes() -> int:
+    """Resident set size of this process (Linux), 0 where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as fd:
+            return int(fd.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def measure(name: str, fn) -> dict:
+    rss_before = current_rss_bytes()
+    start = time.perf_counter()
+    error = None
+    try:
+        fn()
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return {
+        "step": name,
+        "seconds": round(time.perf_counter() - start, 4),
+        "rss_delta_mb": round((current_rss_bytes() - rss_before) / 2**20, 2),
+        "error": error,
+    }
+
+
+HEAVY_MODULES = ("tensorflow", "keras", "sklearn", "pandas", "pymysql")
+
+
+def import_in_child(module: str, top: int) -> dict:
+    """
+    Import `module` in a fresh interpreter under `python -X importtime`.
+
+    Returns the `top` modules by cumulative import time and which of the
+    heavy optional modules the import pulled in.
+    """
+    code = (
+        f"import {module}; import json, sys; "
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        if not self_us.strip().isdigit():
+            continue  # header line
+        modules.append(
+            {
+                "module": name.strip(),
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+            }
+        )
+    modules.sort(key=lambda entry: entry["cumulative_ms"], reverse=True)
+    return {
+        "returncode": result.returncode,
+        "heavy_modules_loaded": (
+            json.loads(result.stdout) if result.returncode == 0 else None
+        ),
+        "slowest_imports": modules[:top],
+    }
+
+
+def startup_steps(with_network: bool, with_model: bool) -> list[tuple[str, object]]:
+    def load_config():
+        from .config import config  # noqa: F401
+
+    steps = [
+        ("import fastapi", lambda: importlib.import_module("fastapi")),
+        ("import sqlmodel", lambda: importlib.import_module("sqlmodel")),
+        ("config (reads .env)", load_config),
+        ("import app.models", lambda: importlib.import_module("app.models")),
+        ("import app.main", lambda: importlib.import_module("app.main")),
+    ]
+    if with_network:
+        from .dependencies.cloud_storage import get_bucket
+        from .dependencies.db import get_engine
+
+        def connect():
+            with get_engine().connect():
+                pass
+
+        steps += [
+            ("create engine", get_engine),
+            ("first database connection", connect),
+            ("storage bucket", get_bucket),
+        ]
+    if with_model:
+        from .model_registry import model_registry
+
+        state = {}
+
+        def load_model():
+            state["recommender"] = model_registry.load()
+
+        steps += [
+            ("import tensorflow", lambda: importlib.import_module("tensorflow")),
+            ("load model and encoders", load_model),
+            (
+                "warm-up prediction",
+                lambda: model_registry.warm_up(state["recommender"]),
+            ),
+        ]
+    return steps
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", default="startup_profile.json")
+    parser.add_argument("--with-network", action="store_true")
+    parser.add_argument("--with-model", action="store_true")
+    parser.add_argument("--top", type=int, default=25)
+    args = parser.parse_args()
+
+    process_start = time.perf_counter()
+    steps = []
+    for name, fn in startup_steps(args.with_network, args.with_model):
+        steps.append(measure(name, fn))
+        print(
+            f"{name:<32} {steps[-1]['seconds'] * 1000:9.1f} ms "
+            f"{steps[-1]['rss_delta_mb']:+8.1f} MB"
+            + (f"  ({steps[-1]['error']})" if steps[-1]["error"] else "")
+        )
+
+    report = {
+        "python": sys.version,
+        "total_seconds": round(time.perf_counter() - process_start, 4),
+        "rss_mb": round(current_rss_bytes() / 2**20, 2),
+        "steps": steps,
+        "app_main_import": import_in_child("app.main", args.top),
+    }
+    with open(args.output, "w") as fd:
+        json.dump(report, fd, indent=2)
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,19 @@
 from .models import Songs, Song_Likes, Histories
+from sqlalchemy import bindparam, update
 from sqlalchemy.sql import func
-from .dependencies.db import SessionDep
-from sqlmodel import select
-from fastapi import UploadFile
-from mutagen.mp3 import MP3
+from .dependencies.db import SessionDep, get_engine
+from sqlmodel import Session, col, select
+
+
+def popularity_score(
+    history_count, like_count, total_history, total_likes, weight_history, weight_likes
+) -> float:
+    # Normalize the history count and like count
+    normalized_history = history_count / total_history if total_history > 0 else 0
+    normalized_likes = like_count / total_likes if total_likes > 0 else 0
+
+    # Calculate weighted popularity
+    return (normalized_history * weight_history) + (normalized_likes * weight_likes)
 
 
 def calculate_song_popularity(
@@ -30,25 +40,76 @@ def calculate_song_popularity(
         select(func.count(Song_Likes.song_id)).where(Song_Likes.song_id == song.id)
     ).one()
 
-    # Normalize the history count and like count
-    normalized_history = history_count / total_history if total_history > 0 else 0
-    normalized_likes = like_count / total_likes if total_likes > 0 else 0
-
-    # Calculate weighted popularity
-    popularity = (normalized_history * weight_history) + (
-        normalized_likes * weight_likes
+    # `updated_at` is pinned: a new score is not an edit of the song, see
+    # `counters`
+    session.execute(
+        update(Songs)
+        .where(Songs.id == song.id)
+        .values(
+            popularity=popularity_score(
+                history_count,
+                like_count,
+                total_history,
+                total_likes,
+                weight_history,
+                weight_likes,
+            ),
+            updated_at=Songs.updated_at,
+        )
+        .execution_options(synchronize_session=False)
     )
-
-    song.popularity = popularity
-    session.add(song)
     session.commit()
 
 
-def calculate_song_duration(song: UploadFile):
-    # Read the file into memory
-    file = song.file
-
-    audio = MP3(file)
-    duration = int(round(audio.info.length))
+def refresh_song_popularity(*song_ids: int, weight_history=0.5, weight_likes=0.5):
+    """
+    Recompute songs' popularity in their own session, e.g. as a background task.
 
-    return duration
+    Same score as `calculate_song_popularity`, but the catalog totals are
+    counted once, the per-song counts come from two grouped queries and every
+    song is updated in one transaction.
+    """
+    with Session(get_engine()) as session:
+        existing = session.exec(
+            select(Songs.id).where(col(Songs.id).in_(song_ids))
+        ).all()
+        if not existing:
+            return
+        total_history = session.exec(select(func.count(Histories.id))).one()
+        total_likes = session.exec(select(func.count(Song_Likes.song_id))).one()
+        history_counts = dict(
+            session.exec(
+                select(Histories.song_id, func.count())
+                .where(col(Histories.song_id).in_(existing))
+                .group_by(Histories.song_id)
+            ).all()
+        )
+        like_counts = dict(
+            session.exec(
+                select(Song_Likes.song_id, func.count())
+                .where(col(Song_Likes.song_id).in_(existing))
+                .group_by(Song_Likes.song_id)
+            ).all()
+        )
+        # One executemany; `updated_at` is pinned as in `calculate_song_popularity`
+        songs = Songs.__table__
+        session.execute(
+            update(songs)
+            .where(songs.c.id == bindparam("song_id"))
+            .values(popularity=bindparam("popularity"), updated_at=songs.c.updated_at),
+            [
+                {
+                    "song_id": song_id,
+                    "popularity": popularity_score(
+                        history_counts.get(song_id, 0),
+                        like_counts.get(song_id, 0),
+                        total_history,
+                        total_likes,
+                        weight_history,
+                        weight_likes,
+                    ),
+                }
+                for song_id in existing
+            ],
+        )
+        session.commit()
@@ -0,0 +1,79 @@
+"""
+Cold-start regression check: how long a fresh interpreter takes to import `app.main`.
+
+Usage:
+    python -m benchmarks.cold_start [--runs 5] [--budget-ms 4000]
+
+Each run imports `app.main` in a new process and reports the time to import
+it. The command exits non-zero when the median exceeds the budget, or when
+the import created the database engine or pulled in a module that should only
+load lazily (TensorFlow, Keras, sklearn, pandas, the MySQL driver).
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from . import common  # noqa: F401  sets the environment the app needs
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - start
+from app.dependencies import db
+print(json.dumps({
+    "seconds": elapsed,
+    "engine_created": db._engine is not None,
+    "lazy_modules_loaded": [m for m in %r if m in sys.modules],
+}))
+"""
+
+LAZY_MODULES = ("tensorflow", "keras", "sklearn", "pandas", "pymysql")
+
+
+def run_once() -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD % (LAZY_MODULES,)],
+        capture_output=True,
+        text=True,
+        env=os.environ.copy(),
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"Importing app.main failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=4000)
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    times_ms = [run["seconds"] * 1000 for run in runs]
+    median_ms = statistics.median(times_ms)
+    print(
+        f"import app.main: median {median_ms:.0f} ms, "
+        f"min {min(times_ms):.0f} ms, max {max(times_ms):.0f} ms "
+        f"({args.runs} runs, budget {args.budget_ms:.0f} ms)"
+    )
+
+    failures = []
+    if median_ms > args.budget_ms:
+        failures.append(f"median {median_ms:.0f} ms exceeds {args.budget_ms:.0f} ms")
+    if any(run["engine_created"] for run in runs):
+        failures.append("the database engine was created at import time")
+    loaded = sorted({m for run in runs for m in run["lazy_modules_loaded"]})
+    if loaded:
+        failures.append(f"modules imported eagerly: {', '.join(loaded)}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
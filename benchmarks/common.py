@@ -0,0 +1,89 @@
+"""Shared setup for the benchmark scripts: settings, a seeded SQLite database and a client."""
+
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+# Settings must exist before anything under `app` is imported
+os.environ.setdefault("DB_USERNAME", "bench")
+os.environ.setdefault("DB_PASSWORD", "bench")
+os.environ.setdefault("DB_NAME", "bench")
+os.environ.setdefault("DB_CONNECTION_NAME", "bench:bench:bench")
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ.setdefault("BUCKET_NAME", "bench")
+os.environ.setdefault("STORAGE_BACKEND", "local")
+os.environ.setdefault("LOCAL_STORAGE_PATH", tempfile.mkdtemp(prefix="tunehive-bench-"))
+
+from sqlalchemy.pool import StaticPool  # noqa: E402
+from sqlmodel import Session, SQLModel, create_engine  # noqa: E402
+
+
+def create_bench_engine():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    from app import models  # noqa: F401  registers the tables
+
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+def seed(engine, users: int = 50, albums_per_user: int = 2, songs_per_album: int = 15):
+    from app.models import Albums, Songs, Users
+
+    rng = random.Random(0)
+    now = datetime.now(timezone.utc)
+    with Session(engine) as session:
+        for u in range(users):
+            user = Users(
+                fullname=f"Singer {u}",
+                username=f"singer{u}",
+                email=f"singer{u}@example.com",
+                password="x",
+            )
+            session.add(user)
+            session.flush()
+            for a in range(albums_per_user):
+                album = Albums(
+                    name=f"Album {u}-{a}",
+                    singer_id=user.id,
+                    cover=f"album_cover/{u}-{a}.png",
+                    cover_url=f"https://example.com/album_cover/{u}-{a}.png",
+                )
+                session.add(album)
+                session.flush()
+                for s in range(songs_per_album):
+                    session.add(
+                        Songs(
+                            name=f"Song {u}-{a}-{s}",
+                            singer_id=user.id,
+                            album_id=album.id,
+                            popularity=rng.random(),
+                            genre="pop, rock",
+                            duration=rng.randint(120, 300),
+                            cover=f"song_cover/{u}-{a}-{s}.png",
+                            cover_url=f"https://example.com/song_cover/{u}-{a}-{s}.png",
+                            song=f"song_file/{u}-{a}-{s}.mp3",
+                            song_url=f"https://example.com/song_file/{u}-{a}-{s}.mp3",
+                            created_at=now - timedelta(minutes=rng.randint(0, 10000)),
+                        )
+                    )
+        session.commit()
+
+
+def bench_client(engine):
+    """TestClient for the app whose sessions use `engine` (lifespan is not run)."""
+    from fastapi.testclient import TestClient
+
+    from app.dependencies.db import get_session
+    from app.main import app
+
+    def get_bench_session():
+        with Session(engine) as session:
+            yield session
+
+    app.dependency_overrides[get_session] = get_bench_session
+    return TestClient(app)
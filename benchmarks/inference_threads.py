@@ -0,0 +1,107 @@
+"""
+Recommendation throughput when sweeping worker processes against TF threads.
+
+Usage:
+    python -m benchmarks.inference_threads [--workers 1,2,4] [--threads 1,2,4,0]
+        [--seconds 10] [--affinity]
+
+Every combination starts `workers` processes, like uvicorn workers on one
+pod. Each process loads the model through the registry, with
+TF_INTRA_OP_THREADS set to the thread count and inter-op set to 1, then
+calls `recommend()` in a loop for the given time. A thread count of 0 keeps
+TensorFlow's default of all cores. With --affinity, each worker is pinned to
+its own slice of the CPUs through INFERENCE_CPU_AFFINITY. The table shows the
+combined requests per second.
+"""
+
+import argparse
+import multiprocessing
+import os
+import time
+
+from . import common  # noqa: F401  sets the environment the app needs
+
+
+def worker(env: dict, seconds: float, start_at: float, results):
+    os.environ.update(env)
+    from app.model_registry import ModelRegistry
+
+    registry = ModelRegistry()
+    registry.start()
+    if not registry.wait():
+        raise SystemExit(f"Model failed to load: {registry.error}")
+    recommender = registry.get()
+    songs = list(recommender.song_encoder.classes_[:10])
+    genres = [[recommender.genre_encoder.classes_[0]]] * len(songs)
+
+    def call():
+        # Same thread setup as the API: pinned executor thread
+        future = registry.executor().submit(recommender.recommend, songs, genres, 10)
+        return future.result()
+
+    call()
+    # Start measuring together so workers compete for the CPU the whole time
+    time.sleep(max(0.0, start_at - time.time()))
+    count = 0
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        call()
+        count += 1
+    results.put(count)
+
+
+def cpu_slices(workers: int) -> list[str]:
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else []
+    if not cpus:
+        return [""] * workers
+    size = max(1, len(cpus) // workers)
+    slices = [cpus[i * size : (i + 1) * size] or cpus for i in range(workers)]
+    return [",".join(map(str, cpu_slice)) for cpu_slice in slices]
+
+
+def run(workers: int, threads: int, seconds: float, affinity: bool) -> float:
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    # Leave time for every worker to import TensorFlow and load the model
+    start_at = time.time() + 30
+    slices = cpu_slices(workers)
+    processes = []
+    for i in range(workers):
+        env = {}
+        if threads:
+            env["TF_INTRA_OP_THREADS"] = str(threads)
+            env["TF_INTER_OP_THREADS"] = "1"
+        if affinity and slices[i]:
+            env["INFERENCE_CPU_AFFINITY"] = slices[i]
+        process = ctx.Process(target=worker, args=(env, seconds, start_at, results))
+        process.start()
+        processes.append(process)
+    total = sum(results.get() for _ in processes)
+    for process in processes:
+        process.join()
+    return total / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--threads", default="1,2,4,0")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--affinity", action="store_true")
+    args = parser.parse_args()
+
+    worker_counts = [int(value) for value in args.workers.split(",")]
+    thread_counts = [int(value) for value in args.threads.split(",")]
+    print(f"cpus: {os.cpu_count()}, affinity: {args.affinity}")
+    header = "workers \\ threads"
+    print(header + "".join(f"{t or 'default':>10}" for t in thread_counts))
+    for workers in worker_counts:
+        row = [
+            run(workers, threads, args.seconds, args.affinity)
+            for threads in thread_counts
+        ]
+        print(f"{workers:>{len(header)}}" + "".join(f"{rps:>10.1f}" for rps in row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Ranking quality and size of the reduced-precision item matrices.
+
+Usage:
+    python -m benchmarks.quantized_ranking [--weights DIR] [--histories 1000]
+        [--k 10] [--seed 0]
+
+Starts from a float32 export of the NumPy weights (`python -m
+app.ml.ml_models.numpy_serving`) and builds the float16 and int8 variants in
+memory with `quantize`. Every variant scores the same random listening
+histories; each catalog item gets a fixed set of genres so that histories
+look like real ones. The float32 model is the reference. For each precision
+the report shows:
+
+- the size of the item embedding plus the `item_output` kernel
+- the largest absolute logit error at the last position
+- how often the top recommendation matches the reference (top-1)
+- the overlap of the top `k` with the reference top `k` (recall@k)
+- the mean reference rank (0-based) of the item each variant puts first
+- the mean latency of one single-history request; reduced precision adds
+  the block-wise conversion of the output kernel to float32
+"""
+
+import argparse
+import statistics
+import time
+
+
+def top_k(logits, k: int):
+    import numpy as np
+
+    return np.argsort(-logits, axis=-1, kind="stable")[:, :k]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--weights", default=None)
+    parser.add_argument("--histories", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import numpy as np
+
+    from app.ml.ml_models.numpy_serving import (
+        ITEM_MATRICES,
+        PRECISIONS,
+        WEIGHTS_DIR,
+        NumpyServing,
+        pad_history,
+        quantize,
+    )
+
+    reference = NumpyServing.load(args.weights or WEIGHTS_DIR)
+    if reference.precision:
+        raise SystemExit("--weights must point to a float32 export")
+    items_size = reference.manifest["items_size"]
+    genres_size = reference.weights["genre_embedding"].shape[0]
+
+    rng = np.random.default_rng(args.seed)
+    catalog_genres = [
+        rng.integers(1, genres_size, size=rng.integers(1, 4)) for _ in range(items_size)
+    ]
+    batch_items = []
+    batch_genres = []
+    for _ in range(args.histories):
+        history = rng.integers(0, items_size, size=rng.integers(1, 16))
+        items, genres = pad_history(history, [catalog_genres[i] for i in history])
+        batch_items.append(items)
+        batch_genres.append(genres)
+    batch_items = np.concatenate(batch_items)
+    batch_genres = np.concatenate(batch_genres)
+
+    def last_logits(serving):
+        return serving.item_head(serving.encode(batch_items, batch_genres)[:, -1])
+
+    expected = last_logits(reference)
+    expected_top = top_k(expected, args.k)
+    # Rank of every item in each reference list, to look up where a variant's
+    # first choice sits
+    expected_rank = np.argsort(np.argsort(-expected, axis=-1, kind="stable"), axis=-1)
+
+    print(
+        f"{args.histories} histories, {items_size} items, k={args.k}, "
+        "reference: float32"
+    )
+    print(
+        f"{'precision':>9} {'size KiB':>9} {'max err':>9} {'top-1':>7} "
+        f"{'recall@k':>9} {'rank':>6} {'ms/req':>7}"
+    )
+    for precision in PRECISIONS:
+        weights, quantized = quantize(reference.weights, precision)
+        serving = NumpyServing(
+            weights, {**reference.manifest, "precision": quantized}, "positions"
+        )
+        size = sum(
+            weights[name].nbytes + getattr(weights.get(f"{name}.scale"), "nbytes", 0)
+            for name in ITEM_MATRICES
+        )
+
+        actual = last_logits(serving)
+        actual_top = top_k(actual, args.k)
+        error = float(np.abs(actual - expected).max())
+        same_top = float((actual_top[:, 0] == expected_top[:, 0]).mean())
+        recall = statistics.fmean(
+            len(set(a) & set(e)) / args.k for a, e in zip(actual_top, expected_top)
+        )
+        first_rank = float(
+            np.take_along_axis(expected_rank, actual_top[:, :1], axis=-1).mean()
+        )
+
+        latencies = []
+        for i in range(min(args.histories, 200)):
+            start = time.perf_counter()
+            serving.item_head(
+                serving.encode(batch_items[i : i + 1], batch_genres[i : i + 1])[:, -1]
+            )
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        print(
+            f"{precision:>9} {size / 1024:>9.1f} {error:>9.2e} {same_top:>7.2%} "
+            f"{recall:>9.2%} {first_rank:>6.2f} {statistics.fmean(latencies):>7.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Latency and agreement of the "positions" and "last" logits modes.
+
+Usage:
+    python -m benchmarks.recommendation_heads [--requests 200] [--count 10]
+
+Both modes are built from the bundled `gru4rec_model.keras` and called
+through the compiled serving function on the same random listening
+histories. The script reports mean and p95 latency per request for each mode.
+It also reports how much the two recommendation lists agree: overlap@count,
+and how often the top recommendation is the same.
+"""
+
+import argparse
+import os
+import statistics
+import time
+
+from . import common  # noqa: F401  sets the environment the app needs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--count", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import numpy as np
+
+    from app.ml.ml_models.models import load_model
+    from app.ml.ml_models.serving import ServingModel, serving_predict
+    from app.model_registry import EXPORTED_MODELS_DIR
+
+    model = load_model(os.path.join(EXPORTED_MODELS_DIR, "gru4rec_model.keras"))
+    rng = np.random.default_rng(args.seed)
+    histories = []
+    for _ in range(args.requests):
+        length = int(rng.integers(1, 11))
+        items = rng.integers(1, model.items_size, size=length)
+        genres = [rng.integers(1, model.genres_size, size=3) for _ in range(length)]
+        histories.append((items, genres))
+
+    results = {}
+    for mode in ("positions", "last"):
+        serving = ServingModel(model, mode)
+        serving_predict(serving, *histories[0], args.count, mode)  # trace
+        latencies = []
+        predictions = []
+        for items, genres in histories:
+            start = time.perf_counter()
+            prediction = serving_predict(serving, items, genres, args.count, mode)
+            predictions.append(prediction)
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+        results[mode] = predictions
+        print(
+            f"{mode:>9}: mean {statistics.fmean(latencies):.2f} ms, "
+            f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.2f} ms"
+        )
+
+    overlap = statistics.fmean(
+        len(set(map(int, a)) & set(map(int, b))) / args.count
+        for a, b in zip(results["positions"], results["last"])
+    )
+    same_top = statistics.fmean(
+        int(a[0]) == int(b[0]) for a, b in zip(results["positions"], results["last"])
+    )
+    print(f"overlap@{args.count}: {overlap:.2%}, same top-1: {same_top:.2%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Recall and latency of the "similar songs" IVF index against brute force.
+
+Usage:
+    python -m benchmarks.similar_songs [--index DIR] [--songs 100000] [--dim 32]
+        [--queries 500] [--k 10] [--probes 1,2,4,8,16,32]
+
+Without `--index` a synthetic catalog of clustered random embeddings is
+indexed, sized like a grown catalog. The bundled model only knows a few dozen
+songs, so its index is too small to need probing. Every query is a catalog
+vector. recall@k is the share of the exact top `k` that the index returns for
+each `n_probe`, and the latency is per query.
+"""
+
+import argparse
+import statistics
+import time
+
+from . import common  # noqa: F401  sets the environment the app needs
+
+
+def synthetic_catalog(songs: int, dim: int, seed: int):
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    # Songs gather around genres / styles, like learned embeddings do
+    centers = rng.standard_normal((max(1, songs // 500), dim))
+    labels = rng.integers(0, len(centers), songs)
+    return (centers[labels] + 0.5 * rng.standard_normal((songs, dim))).astype(
+        np.float32
+    )
+
+
+def timed(fn, queries) -> tuple[list, float, float]:
+    results = []
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(fn(query))
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return results, statistics.fmean(latencies), latencies[int(len(latencies) * 0.95)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--index", default=None)
+    parser.add_argument("--songs", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=32)
+    parser.add_argument("--lists", type=int, default=None)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--probes", default="1,2,4,8,16,32")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import numpy as np
+
+    from app.similar_songs import IVFIndex
+
+    if args.index:
+        index = IVFIndex.load(args.index)
+    else:
+        embeddings = synthetic_catalog(args.songs, args.dim, args.seed)
+        start = time.perf_counter()
+        index = IVFIndex.build(
+            embeddings, [str(i) for i in range(args.songs)], args.lists
+        )
+        print(f"built in {time.perf_counter() - start:.1f}s")
+    print(
+        f"{len(index.vectors)} songs, {len(index.centroids)} lists, "
+        f"{args.queries} queries, k={args.k}"
+    )
+
+    rng = np.random.default_rng(args.seed)
+    rows = rng.choice(len(index.vectors), min(args.queries, len(index.vectors)))
+    queries = [np.asarray(index.vectors[row]) for row in rows]
+
+    exact, mean, p95 = timed(lambda q: index.search_exact(q, args.k)[0], queries)
+    print(f"{'exact':>9}: recall 100.00%, mean {mean:.3f} ms, p95 {p95:.3f} ms")
+
+    for n_probe in map(int, args.probes.split(",")):
+        found, mean, p95 = timed(
+            lambda q: index.search(q, args.k, n_probe)[0], queries
+        )
+        recall = statistics.fmean(
+            len(set(a.tolist()) & set(e.tolist())) / args.k
+            for a, e in zip(found, exact)
+        )
+        print(
+            f"{'probe ' + str(n_probe):>9}: recall {recall:.2%}, "
+            f"mean {mean:.3f} ms, p95 {p95:.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Requests per second on `GET /songs/` and the cost of serializing one page.
+
+Usage:
+    python -m benchmarks.songs_list_rps [--seconds 5] [--per-page 30]
+
+The endpoint is driven in-process through the TestClient against a seeded
+SQLite database, so the numbers isolate routing, query and serialization work
+from network and MySQL latency. The second section compares the old response
+path (validate each row, `jsonable_encoder`, `json.dumps`) with
+`serialization.list_response` on the same rows.
+"""
+
+import argparse
+import json
+import time
+
+from .common import bench_client, create_bench_engine, seed
+
+
+def measure(fn, seconds: float) -> tuple[int, float]:
+    count = 0
+    start = time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < seconds:
+        fn()
+        count += 1
+    return count, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--per-page", type=int, default=30)
+    args = parser.parse_args()
+
+    engine = create_bench_engine()
+    seed(engine)
+    client = bench_client(engine)
+
+    url = f"/songs/?itemPerPage={args.per_page}&top=true"
+    response = client.get(url)
+    assert response.status_code == 200, response.text
+
+    count, elapsed = measure(lambda: client.get(url), args.seconds)
+    print(f"GET {url}: {count / elapsed:.1f} req/s ({count} requests)")
+
+    from fastapi.encoders import jsonable_encoder
+    from sqlalchemy.orm import selectinload
+    from sqlmodel import Session, select
+
+    from app.models import Songs
+    from app.response_models import SongPublic
+    from app.serialization import list_response
+
+    with Session(engine) as session:
+        rows = session.exec(
+            select(Songs)
+            .options(selectinload(Songs.singer), selectinload(Songs.album))
+            .limit(args.per_page)
+        ).all()
+
+        def standard():
+            items = [SongPublic.model_validate(row) for row in rows]
+            return json.dumps(jsonable_encoder(items)).encode()
+
+        def fast():
+            return list_response(SongPublic, rows).body
+
+        for name, fn in [("standard", standard), ("fast", fast)]:
+            count, elapsed = measure(fn, args.seconds / 2)
+            print(
+                f"serialize {len(rows)} songs, {name}: "
+                f"{elapsed / count * 1e6:.1f} us/page"
+            )
+
+
+if __name__ == "__main__":
+    main()